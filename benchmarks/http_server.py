@@ -0,0 +1,269 @@
+"""Throughput and latency of the poll results server under many concurrent screens.
+
+`create_app` is served from a storage seeded with synthetic teams, polls and votes,
+on the same event loop as the bot would share with it. Concurrent clients on a thread
+of their own hammer the results endpoints in each scenario:
+
+    * active: `/polls/active`.
+    * poll: `/polls/{pid}` of random polls.
+    * revalidate: `/polls/active` with the ETag of the last response, like idle screens.
+    * storm: `/polls/active` while votes are written through the same database.
+
+Requests/sec, latency percentiles and the lag of the server's event loop are reported
+for each scenario, so changes to the results path can be compared run over run:
+
+    python -m benchmarks.http_server --teams 100 --clients 50 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from ioibot import http_server
+from ioibot.poll_results import ActivePoll
+from ioibot.storage import Storage
+
+from benchmarks.synthetic import CHOICES, make_storage, team_codes, write_config
+
+SCENARIOS = ["active", "poll", "revalidate", "storm"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """The nearest-rank percentile of the values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+async def seed(store: Storage, teams: int, polls: int, votes: int) -> List[int]:
+    """Create polls with votes from random voting teams, the last of which is active.
+
+    Returns:
+        The IDs of the polls.
+    """
+    db = store.vdb
+    voters = team_codes(teams)[1:]
+    choices = "/".join(CHOICES)
+
+    poll_ids = []
+    for number in range(polls):
+        [poll_id] = await db.fetchone(
+            "INSERT INTO polls (question, choices, active) VALUES (?, ?, 0) "
+            "RETURNING poll_id",
+            [f"Question {number}?", choices],
+        )
+        poll_ids.append(poll_id)
+
+        voted = random.sample(voters, min(votes, len(voters)))
+        await db.executemany(
+            "INSERT INTO votes (poll_id, team_code, choice, voted_by, voted_at) "
+            "VALUES (?, ?, ?, ?, '2022-08-08 12:00:00')",
+            [[poll_id, code, random.choice(CHOICES), f"@{code}"] for code in voted],
+        )
+
+    await db.execute("UPDATE polls SET active = 1 WHERE poll_id = ?", [poll_ids[-1]])
+    store.active_poll.set(
+        ActivePoll.from_row(poll_ids[-1], f"Question {polls - 1}?", choices)
+    )
+    return poll_ids
+
+
+async def measure_loop_lag(lags: List[float], interval: float = 0.01) -> None:
+    """Record how late the event loop wakes up from short sleeps, in milliseconds"""
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append((loop.time() - start - interval) * 1000)
+
+
+async def vote_storm(store: Storage, teams: int, rate: float) -> None:
+    """Keep voting teams changing their votes on the active poll at `rate` votes/sec"""
+    active_poll = await store.active_poll.get()
+    codes = team_codes(teams)[1:]
+    loop = asyncio.get_event_loop()
+
+    pending = set()
+    next_at = loop.time()
+    while True:
+        code = random.choice(codes)
+        vote = asyncio.ensure_future(
+            store.votes.submit(
+                active_poll.poll_id, code, f"Country {code}",
+                random.choice(CHOICES), f"@{code}",
+            )
+        )
+        pending.add(vote)
+        vote.add_done_callback(pending.discard)
+
+        next_at += 1 / rate
+        await asyncio.sleep(max(0, next_at - loop.time()))
+
+
+def run_clients(
+    url: str, scenario: str, poll_ids: List[int], clients: int, duration: float
+) -> Dict[str, Any]:
+    """Run the clients of a scenario on a new event loop. Called on its own thread."""
+
+    async def client(session: aiohttp.ClientSession, deadline: float, results):
+        etag: Optional[str] = None
+        while time.perf_counter() < deadline:
+            if scenario == "poll":
+                path = f"/polls/{random.choice(poll_ids)}"
+            else:
+                path = "/polls/active"
+
+            headers = {}
+            if scenario == "revalidate" and etag:
+                headers["If-None-Match"] = etag
+
+            start = time.perf_counter()
+            async with session.get(url + path, headers=headers) as response:
+                await response.read()
+                etag = response.headers.get("ETag", etag)
+                results["latencies"].append((time.perf_counter() - start) * 1000)
+                results["statuses"][response.status] += 1
+
+    async def main():
+        results = {"latencies": [], "statuses": Counter()}
+        connector = aiohttp.TCPConnector(limit=clients)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = time.perf_counter()
+            deadline = start + duration
+            await asyncio.gather(
+                *(client(session, deadline, results) for _ in range(clients))
+            )
+            results["seconds"] = time.perf_counter() - start
+        return results
+
+    return asyncio.run(main())
+
+
+async def run_scenario(
+    args: argparse.Namespace,
+    store: Storage,
+    url: str,
+    scenario: str,
+    poll_ids: List[int],
+) -> Dict[str, Any]:
+    lags: List[float] = []
+    background = [asyncio.ensure_future(measure_loop_lag(lags))]
+    if scenario == "storm":
+        background.append(
+            asyncio.ensure_future(vote_storm(store, args.teams, args.vote_rate))
+        )
+
+    # The clients run on a thread, so that they don't compete for the server's loop
+    loop = asyncio.get_event_loop()
+    results = await loop.run_in_executor(
+        None, run_clients, url, scenario, poll_ids, args.clients, args.duration
+    )
+
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+
+    latencies = results["latencies"]
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / results["seconds"],
+        "statuses": dict(results["statuses"]),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+            "max": max(latencies, default=0.0),
+        },
+        "loop_lag_ms": {
+            "p50": percentile(lags, 0.5),
+            "p99": percentile(lags, 0.99),
+            "max": max(lags, default=0.0),
+        },
+    }
+
+
+async def run(args: argparse.Namespace, directory: str) -> Dict[str, Any]:
+    random.seed(args.seed)
+    config = write_config(directory)
+    store = make_storage(config, args.teams)
+    poll_ids = await seed(store, args.teams, args.polls, args.votes)
+
+    app = await http_server.create_app(config, store)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    report = {
+        "teams": args.teams,
+        "polls": args.polls,
+        "votes_per_poll": args.votes,
+        "clients": args.clients,
+        "scenarios": {},
+    }
+    try:
+        for scenario in args.scenarios:
+            report["scenarios"][scenario] = await run_scenario(
+                args, store, url, scenario, poll_ids
+            )
+    finally:
+        await runner.cleanup()
+        store.vdb.executor.shutdown()
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--votes", type=int, default=90, help="votes per poll")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument(
+        "--duration", type=float, default=5, help="seconds per scenario"
+    )
+    parser.add_argument(
+        "--vote-rate", type=float, default=200, help="votes/sec in the storm scenario"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = asyncio.run(run(args, directory))
+
+    print(
+        f"{report['teams']} teams, {report['polls']} polls of "
+        f"{report['votes_per_poll']} votes, {report['clients']} clients"
+    )
+    print(
+        f"{'scenario':>10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} "
+        f"{'lag p99':>8} {'lag max':>8}  statuses"
+    )
+    for scenario, result in report["scenarios"].items():
+        latency, lag = result["latency_ms"], result["loop_lag_ms"]
+        print(
+            f"{scenario:>10} {result['requests_per_second']:>8.0f} "
+            f"{latency['p50']:>8.2f} {latency['p99']:>8.2f} {latency['p999']:>9.2f} "
+            f"{lag['p99']:>8.2f} {lag['max']:>8.2f}  {result['statuses']}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
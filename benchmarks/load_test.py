@@ -0,0 +1,316 @@
+"""Command throughput and latency of the bot, against a local stand-in homeserver.
+
+The bot's storage is started from a synthetic roster snapshot with a sqlite database,
+Dropbox is replaced by an in-process stub, and a fake homeserver implementing `/sync`,
+`/send`, `/invite` and `/join` runs on its own thread and event loop. Bursts of `vote`,
+`info`, `accounts` and `dropbox` commands are fed to `Callbacks.message`, each leader
+in a direct message room of their own, and a command's latency is the time until its
+reply reaches the homeserver.
+
+Nothing leaves the machine, so this can run in CI:
+
+    python -m benchmarks.load_test --teams 100 --bursts 5 --burst-size 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from nio import AsyncClient, AsyncClientConfig, MatrixRoom, RoomMessageText
+
+from ioibot.callbacks import Callbacks
+from ioibot.chat_functions import set_outbound_queue
+from ioibot.outbound import OutboundQueue
+from ioibot.poll_results import ActivePoll
+
+from benchmarks.synthetic import (
+    BOT_USER_ID,
+    CHOICES,
+    SERVER_NAME,
+    leader_mxid,
+    make_storage,
+    team_codes,
+    write_config,
+)
+
+COMMANDS = ["vote", "info", "accounts", "dropbox"]
+
+
+class FakeHomeserver:
+    def __init__(self, rate_limit_every: int = 0, sync_wait: float = 0.05):
+        """Just enough of the client-server API for the bot to run against.
+
+        Runs on a thread of its own, so that serving requests doesn't add to the bot's
+        event loop.
+
+        Args:
+            rate_limit_every: Answer every n-th send with M_LIMIT_EXCEEDED, or never
+                if 0.
+
+            sync_wait: How long a sync long-polls before returning nothing, in seconds.
+        """
+        self.rate_limit_every = rate_limit_every
+        self.sync_wait = sync_wait
+
+        # (room ID, perf_counter time) of every accepted send, in order of arrival
+        self.sent: List[Tuple[str, float]] = []
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.url: Optional[str] = None
+
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._runner: Optional[web.AppRunner] = None
+        self._send_count = 0
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._started.wait()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_server())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _start_server(self) -> None:
+        app = web.Application()
+        prefix = "/_matrix/client/{version}"
+        app.router.add_get(prefix + "/sync", self._sync)
+        app.router.add_put(prefix + "/rooms/{room_id}/send/{type}/{txn_id}", self._send)
+        app.router.add_post(prefix + "/rooms/{room_id}/invite", self._invite)
+        app.router.add_post(prefix + "/join/{room_id}", self._join)
+        app.router.add_post(prefix + "/rooms/{room_id}/join", self._join)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def _sync(self, request: web.Request) -> web.Response:
+        self.requests["sync"] += 1
+        timeout = int(request.query.get("timeout", "0")) / 1000
+        await asyncio.sleep(min(timeout, self.sync_wait))
+        return web.json_response(
+            {
+                "next_batch": f"s{self.requests['sync']}",
+                "rooms": {"join": {}, "invite": {}, "leave": {}},
+                "to_device": {"events": []},
+                "presence": {"events": []},
+                "account_data": {"events": []},
+            }
+        )
+
+    async def _send(self, request: web.Request) -> web.Response:
+        self.requests["send"] += 1
+        self._send_count += 1
+        if self.rate_limit_every and self._send_count % self.rate_limit_every == 0:
+            return web.json_response(
+                {"errcode": "M_LIMIT_EXCEEDED", "error": "Too many requests",
+                 "retry_after_ms": 20},
+                status=429,
+            )
+
+        await request.read()
+        self.sent.append((request.match_info["room_id"], time.perf_counter()))
+        return web.json_response({"event_id": f"$event{self.requests['send']}"})
+
+    async def _invite(self, request: web.Request) -> web.Response:
+        self.requests["invite"] += 1
+        return web.json_response({})
+
+    async def _join(self, request: web.Request) -> web.Response:
+        self.requests["join"] += 1
+        return web.json_response({"room_id": request.match_info["room_id"]})
+
+
+def make_event(sender: str, body: str, number: int) -> RoomMessageText:
+    return RoomMessageText.from_dict(
+        {
+            "type": "m.room.message",
+            "event_id": f"$command{number}",
+            "sender": sender,
+            "origin_server_ts": int(time.time() * 1000),
+            "content": {"msgtype": "m.text", "body": body},
+        }
+    )
+
+
+def command_body(command: str, codes: List[str]) -> str:
+    if command == "vote":
+        return f"vote {random.choice(CHOICES)}"
+    if command == "info":
+        return f"info {random.choice(codes).lower()}"
+    if command == "accounts":
+        return "accounts contest"
+    return "dropbox"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """The nearest-rank percentile of the values"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+async def run(args: argparse.Namespace, directory: str) -> Dict[str, Any]:
+    random.seed(args.seed)
+    homeserver = FakeHomeserver(rate_limit_every=args.rate_limit_every)
+    homeserver.start()
+
+    config = write_config(directory, args.concurrency, args.max_pending)
+    store = make_storage(config, args.teams, args.dropbox_latency)
+
+    [poll_id] = await store.vdb.fetchone(
+        "INSERT INTO polls (question, choices, active) VALUES (?, ?, 1) "
+        "RETURNING poll_id",
+        ["Is this a benchmark?", "/".join(CHOICES)],
+    )
+    store.active_poll.set(
+        ActivePoll.from_row(poll_id, "Is this a benchmark?", "/".join(CHOICES))
+    )
+
+    client = AsyncClient(
+        homeserver.url,
+        BOT_USER_ID,
+        device_id="BENCHMARK",
+        config=AsyncClientConfig(
+            max_limit_exceeded=0, max_timeouts=0, encryption_enabled=False
+        ),
+    )
+    client.access_token = "token"
+    set_outbound_queue(client, OutboundQueue(client, concurrency=args.send_concurrency))
+    callbacks = Callbacks(client, store, config)
+    sync = asyncio.ensure_future(client.sync_forever(timeout=30000))
+
+    # Every voting team's leader talks to the bot in a room of their own
+    codes = team_codes(args.teams)
+    voters = codes[1:]
+    rooms = {
+        code: MatrixRoom(f"!dm-{code.lower()}:{SERVER_NAME}", BOT_USER_ID)
+        for code in voters
+    }
+
+    # Dispatch times of the commands sent to each room, and their commands
+    dispatched: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    number = 0
+    start = time.perf_counter()
+    for _ in range(args.bursts):
+        expected = len(homeserver.sent) + args.burst_size
+        for _ in range(args.burst_size):
+            code = random.choice(voters)
+            command = random.choice(COMMANDS)
+            room = rooms[code]
+            number += 1
+
+            dispatched[room.room_id].append((time.perf_counter(), command))
+            body = command_body(command, codes)
+            await callbacks.message(room, make_event(leader_mxid(code), body, number))
+
+        # Wait for every reply of the burst to arrive
+        deadline = time.perf_counter() + args.timeout
+        while len(homeserver.sent) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        if args.pause:
+            await asyncio.sleep(args.pause)
+
+    elapsed = time.perf_counter() - start - args.pause * args.bursts
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    sync.cancel()
+    await client.close()
+    homeserver.stop()
+    store.vdb.executor.shutdown()
+
+    # Replies to a room arrive in the order of its commands, one reply per command
+    replies: Dict[str, List[float]] = defaultdict(list)
+    for room_id, received_at in homeserver.sent:
+        replies[room_id].append(received_at)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    for room_id, commands in dispatched.items():
+        for (sent_at, command), received_at in zip(commands, replies[room_id]):
+            latencies[command].append((received_at - sent_at) * 1000)
+    latencies["all"] = [value for values in latencies.values() for value in values]
+
+    return {
+        "teams": args.teams,
+        "commands": number,
+        "replies": len(homeserver.sent),
+        "seconds": elapsed,
+        "commands_per_second": number / elapsed,
+        "latency_ms": {
+            command: {
+                "count": len(values),
+                "p50": percentile(values, 0.5),
+                "p99": percentile(values, 0.99),
+                "max": max(values),
+            }
+            for command, values in latencies.items()
+            if values
+        },
+        "requests": dict(homeserver.requests),
+        "command_wait": callbacks.commands.stats(),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=500)
+    parser.add_argument(
+        "--pause", type=float, default=0.5, help="seconds between bursts"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-pending", type=int, default=100000)
+    parser.add_argument("--send-concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--dropbox-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds per burst")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = asyncio.run(run(args, directory))
+
+    print(
+        f"{report['commands']} commands from {report['teams']} teams in "
+        f"{report['seconds']:.2f}s: {report['commands_per_second']:.0f} commands/s, "
+        f"{report['replies']} replies"
+    )
+    print(f"{'command':>9} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for command, latency in report["latency_ms"].items():
+        print(
+            f"{command:>9} {latency['count']:>7} {latency['p50']:>9.2f} "
+            f"{latency['p99']:>9.2f} {latency['max']:>9.2f}"
+        )
+    print(
+        f"max RSS {report['max_rss_mb']:.1f} MB "
+        f"(+{report['rss_growth_mb']:.1f} MB while running)"
+    )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Latency of assembling poll results, at increasing numbers of teams and votes.
+
+Compares assembling the votes dictionary by iterating over the teams sheet row by row
+with assembling it from the roster's precomputed (code, name) pairs, and measures a
+full uncached rebuild of a poll's result from a sqlite database.
+
+Run from the root of the repository:
+
+    python -m benchmarks.poll_results
+"""
+import asyncio
+import os
+import tempfile
+import timeit
+from typing import Any, Dict, List, Tuple
+from unittest.mock import Mock
+
+import pandas as pd
+
+from ioibot.database import Database
+from ioibot.poll_results import PollEvents, PollResults
+
+SCALES = [100, 1000, 10000]
+CHOICES = ["yes", "no", "abstain"]
+
+
+def make_teams(count: int) -> pd.DataFrame:
+    codes = [f"T{i:05d}" for i in range(count)]
+    return pd.DataFrame(
+        {
+            "Code": codes,
+            "Name": [f"Team {code}" for code in codes],
+            "Visible": [1] * count,
+            # Every tenth team does not vote, like the host and guest teams
+            "Voting": [0 if i % 10 == 0 else 1 for i in range(count)],
+        }
+    )
+
+
+def make_votes(teams: pd.DataFrame) -> List[Tuple[str, str]]:
+    # Two thirds of the teams have voted
+    return [
+        (code, CHOICES[i % len(CHOICES)])
+        for i, code in enumerate(teams["Code"])
+        if i % 3
+    ]
+
+
+def assemble_iterrows(
+    teams: pd.DataFrame, vote_rows: List[Tuple[str, str]]
+) -> Dict[str, Any]:
+    """How results were assembled before the roster precomputed team names"""
+    vote_result = {vote[0]: vote[1] for vote in vote_rows}
+
+    votes = {}
+    for key, team in teams.iterrows():
+        if team["Voting"] == 0:
+            continue
+        if team["Code"] in vote_result:
+            votes[team["Name"]] = vote_result[team["Code"]]
+        else:
+            votes[team["Name"]] = None
+    return votes
+
+
+def assemble_precomputed(
+    team_names: List[Tuple[str, str]], vote_rows: List[Tuple[str, str]]
+) -> Dict[str, Any]:
+    vote_result = dict(vote_rows)
+    return {name: vote_result.get(code) for code, name in team_names}
+
+
+def time_ms(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+async def rebuild_ms(teams: pd.DataFrame, vote_rows: List[Tuple[str, str]]) -> float:
+    """The median time of an uncached rebuild of a poll's result from sqlite"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        db = Database("sqlite", os.path.join(tempdir, "bench.db"))
+        await db.execute(
+            """CREATE TABLE votes (poll_id INTEGER, team_code VARCHAR, choice VARCHAR,
+            UNIQUE (poll_id, team_code))"""
+        )
+        await db.execute(
+            "CREATE INDEX votes_poll ON votes (poll_id, team_code, choice)"
+        )
+        await db.executemany(
+            "INSERT INTO votes VALUES (1, ?, ?)", [list(row) for row in vote_rows]
+        )
+
+        store = Mock()
+        store.vdb = db
+        store.roster.team_names = list(zip(teams["Code"], teams["Name"]))
+        voting = teams[teams["Voting"] != 0]
+        store.roster.voting_team_names = list(zip(voting["Code"], voting["Name"]))
+        results = PollResults(store, PollEvents())
+
+        loop = asyncio.get_event_loop()
+        timings = []
+        for _ in range(21):
+            results.invalidate_all()
+            start = loop.time()
+            await results._assemble(1, "Is this a question?", voting_only=True)
+            timings.append((loop.time() - start) * 1000)
+
+        db.executor.shutdown()
+        return sorted(timings)[len(timings) // 2]
+
+
+def main() -> None:
+    print(
+        f"{'teams':>7} {'iterrows ms':>12} {'precomputed ms':>15} "
+        f"{'speedup':>8} {'rebuild ms':>11}"
+    )
+    for count in SCALES:
+        teams = make_teams(count)
+        vote_rows = make_votes(teams)
+        voting = teams[teams["Voting"] != 0]
+        team_names = list(zip(voting["Code"], voting["Name"]))
+
+        assert assemble_iterrows(teams, vote_rows) == assemble_precomputed(
+            team_names, vote_rows
+        )
+
+        number = max(1, 10000 // count)
+        before = time_ms(lambda: assemble_iterrows(teams, vote_rows), number)
+        after = time_ms(
+            lambda: assemble_precomputed(team_names, vote_rows), number * 100
+        )
+        rebuild = asyncio.run(rebuild_ms(teams, vote_rows))
+
+        print(
+            f"{count:>7} {before:>12.3f} {after:>15.4f} "
+            f"{before / after:>7.0f}x {rebuild:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""A bot storage with synthetic data for the benchmarks, which needs no network."""
+import os
+import time
+from typing import Dict, List
+
+import dropbox
+import pandas as pd
+import yaml
+
+from ioibot.config import Config
+from ioibot.dropbox_listing import DropboxListing
+from ioibot.roster import Roster, save_snapshot
+from ioibot.storage import Storage
+
+# The homeserver the synthetic users belong to
+HOMESERVER_URL = "https://bench.localhost"
+SERVER_NAME = HOMESERVER_URL[len("https://") :]
+BOT_USER_ID = f"@bot:{SERVER_NAME}"
+
+CHOICES = ["yes", "no", "abstain"]
+
+
+def team_codes(teams: int) -> List[str]:
+    return [f"T{i:04d}" for i in range(teams)]
+
+
+def leader_mxid(code: str) -> str:
+    """The MXID of the leader of a synthetic team"""
+    return f"@leader-{code.lower()}:{SERVER_NAME}"
+
+
+def make_sheets(teams: int) -> Dict[str, pd.DataFrame]:
+    """Build every datasource sheet for a number of teams.
+
+    Every team has a leader and a deputy leader, and four contestants of whom the
+    odd-numbered teams' are online. The first team is the host, which does not vote.
+    """
+    codes = team_codes(teams)
+
+    leaders = []
+    for code in codes:
+        for role, user_id in [("Team Leader", "leader"), ("Deputy Leader", "deputy")]:
+            leaders.append(
+                {
+                    "UserID": f"{user_id}-{code.lower()}",
+                    "TeamCode": code,
+                    "RealTeamCode": code,
+                    "Name": f"{role} of {code}",
+                    "Role": role,
+                    "Chair": "",
+                    "Matrix Exists": "Y",
+                    "Translating": "Y",
+                }
+            )
+
+    contestants = [
+        {
+            "ContestantCode": f"{code.lower()}{number}",
+            "RealTeamCode": code,
+            "FirstName": "Contestant",
+            "LastName": f"{code} {number}",
+            "Online": i % 2,
+            "Password": f"password-{code.lower()}{number}",
+        }
+        for i, code in enumerate(codes)
+        for number in range(1, 5)
+    ]
+
+    return {
+        "teams": pd.DataFrame(
+            {
+                "Code": codes,
+                "Name": [f"Country {code}" for code in codes],
+                "Visible": [1] * teams,
+                "Voting": [0] + [1] * (teams - 1),
+            }
+        ),
+        "leaders": pd.DataFrame(leaders),
+        "contestants": pd.DataFrame(contestants),
+        "testing_acc": pd.DataFrame(contestants).drop(columns=["Online"]),
+        "translation_acc": pd.DataFrame(
+            {"TeamCode": codes, "Password": [f"translate-{code}" for code in codes]}
+        ),
+        "tokens": pd.DataFrame(
+            {"TeamCode": codes, "Token": [f"token-{code}" for code in codes]}
+        ),
+        "dropbox_url": pd.DataFrame(
+            {
+                "RealTeamCode": codes,
+                **{
+                    f"Day {day}": [
+                        f"https://www.dropbox.com/request/{code}-{day}"
+                        for code in codes
+                    ]
+                    for day in range(3)
+                },
+            }
+        ),
+    }
+
+
+class FakeDropbox:
+    def __init__(self, latency: float):
+        """Answers folder listings with a couple of uploaded files, after a delay"""
+        self.latency = latency
+
+    def files_list_folder(self, path: str, recursive: bool = False):
+        time.sleep(self.latency)
+        entries = [
+            dropbox.files.FileMetadata(
+                name=name,
+                path_lower=f"{path}/{name}".lower(),
+                path_display=f"{path}/{name}",
+            )
+            for name in ["solution.cpp", "notes.pdf"]
+        ]
+        return dropbox.files.ListFolderResult(
+            entries=entries, cursor="c", has_more=False
+        )
+
+    def files_list_folder_continue(self, cursor: str):
+        time.sleep(self.latency)
+        return dropbox.files.ListFolderResult(entries=[], cursor=cursor, has_more=False)
+
+
+def write_config(
+    directory: str, concurrency: int = 16, max_pending: int = 256
+) -> Config:
+    """Write a config based on the sample config, without anything reaching out"""
+    with open("sample.config.yaml") as file:
+        config = yaml.safe_load(file)
+
+    config["commands"] = {"concurrency": concurrency, "max_pending": max_pending}
+    config["matrix"].update(
+        user_id=BOT_USER_ID,
+        user_token="token",
+        homeserver_url=HOMESERVER_URL,
+        device_id="BENCHMARK",
+    )
+    config["storage"] = {
+        "database": f"sqlite://{os.path.join(directory, 'bot.db')}",
+        "store_path": os.path.join(directory, "store"),
+    }
+    config["logging"]["level"] = "WARNING"
+    config["logging"]["console_logging"]["enabled"] = False
+
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w") as file:
+        yaml.safe_dump(config, file)
+    return Config(path)
+
+
+def make_storage(config: Config, teams: int, dropbox_latency: float = 0.05) -> Storage:
+    """Start the bot's storage from a synthetic roster snapshot, with a stub Dropbox"""
+    # Start from a snapshot, so the roster isn't downloaded
+    save_snapshot(
+        os.path.join(config.store_path, "roster.db"),
+        Roster(make_sheets(teams), config.homeserver_url),
+    )
+    store = Storage(config.database, config)
+    store.dropbox = DropboxListing(FakeDropbox(dropbox_latency), config.db_cache_ttl)
+    return store
@@ -1,38 +1,62 @@
-import asyncio
-import dropbox
+import logging
+import os
 from datetime import datetime
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
 
 from nio import AsyncClient, MatrixRoom, RoomMessageText
 
-from ioibot.chat_functions import react_to_event, send_text_to_room, make_pill
+from ioibot.chat_functions import (
+    make_pill,
+    react_to_event,
+    render_markdown,
+    send_text_to_room,
+)
 from ioibot.config import Config
+from ioibot.errors import DatasourceError
+from ioibot.invites import BulkInviter
+from ioibot.logs import request_scope
+from ioibot.metrics import Histogram
+from ioibot.poll_results import ActivePoll
+from ioibot.roster import Roster
 from ioibot.storage import Storage
+from ioibot.watchdog import PROFILER, HandlerInfo, handling
+
+logger = logging.getLogger(__name__)
+
+COMMAND_SECONDS = Histogram(
+    "ioibot_command_seconds", "Time spent handling commands, by command", ["command"]
+)
+
+# Roles listed by `info ic`, `info sc` and `info tc`
+COMMITTEE_ROLES = {
+    'IC': ['President', 'Chair of IOI / IC Member', 'IC Member', 'Secretary', 'Treasurer'],
+    'SC': ['ISC Member', 'HSC', 'Invited HSC'],
+    'TC': ['ITC Member', 'HTC', 'Invited HTC'],
+}
+
+# Roles listed by `info <3-letter-country-code>`
+TEAM_ROLES = [
+    'Team Leader', 'Deputy Leader', 'Guest', 'Remote Adjunct (not on site)',
+    'Invited Observer/Guest'
+]
 
 class User():
-    def __init__(self, store: Storage, config: Config, username: str):
+    def __init__(self, roster: Roster, config: Config, username: str):
         self.username = username
         self.config = config
         self.role = "Unknown"
 
-        users = store.leaders
-        teams = store.teams
-
-        user = users.loc[self._get_username(users['UserID']) == username, \
-                        ['TeamCode', 'RealTeamCode', 'Name', 'Role', 'UserID']]
+        user = roster.users.get(username)
 
-        if not user.empty:
-            country = teams.loc[teams['Code'] == user.iat[0, 0], ['Name']]
-            # if the user is not specified in the spreadsheet,
-            # or if the country code is not found,
-            # assume that the user is unauthorized to use this bot.
-            if country.empty:
-                self.role = "Unknown"
-            else:
-                self.team = user.iat[0, 0]
-                self.real_team = user.iat[0, 1]
-                self.name = user.iat[0, 2]
-                self.role = user.iat[0, 3]
-                self.country = country.iat[0, 0]
+        # if the user is not specified in the spreadsheet,
+        # or if the country code is not found,
+        # assume that the user is unauthorized to use this bot.
+        if user is not None:
+            self.team = user.team
+            self.real_team = user.real_team
+            self.name = user.name
+            self.role = user.role
+            self.country = user.country
 
     def is_leader(self):
         return self.is_tc() or self.role in ['Team Leader', 'Deputy Leader']
@@ -40,9 +64,31 @@ class User():
     def is_tc(self):
         return 'TC' in self.role
 
-    def _get_username(self, name):
-        homeserver = self.config.homeserver_url[8:]
-        return "@" + name + ":" + homeserver
+class Permission(NamedTuple):
+    """A check a user must pass to use a command"""
+
+    check: Callable[[User], bool]
+    denied: str
+
+
+LEADER = Permission(
+    User.is_leader, "Only Team Leader and Deputy Leader can use this command."
+)
+VOTER = Permission(
+    lambda user: user.team != "IOI", "Sorry, you are not allowed to vote."
+)
+HTC = Permission(User.is_tc, "Only HTC can use this command.")
+
+
+class CommandSpec(NamedTuple):
+    """An entry of the command registry"""
+
+    handler: Callable[["Command"], Awaitable[None]]
+    # Checked in order, the first failing check is reported to the user
+    permissions: Tuple[Permission, ...]
+    # Shown by the help command, if set
+    usage: Optional[str]
+
 
 class Command:
     def __init__(
@@ -77,8 +123,29 @@ class Command:
         self.event = event
         self.args = self.command.split()[1:]
 
+        # Hold on to the current roster, so that the whole command sees the same one
+        # even if it is refreshed in the meantime
+        self.roster = store.roster
+
     async def process(self):
-        user = User(self.store, self.config, self.event.sender)
+        """Process the command"""
+        words = self.command.split()
+        spec = COMMANDS.get(words[0].lower()) if words else None
+        name = words[0].lower() if spec is not None else "unknown"
+
+        # Tag the command's log records with its event ID, and tell the watchdog what
+        # is running, should it block the event loop
+        handler = HandlerInfo(name, self.room.room_id, self.event.sender)
+        with request_scope(self.event.event_id), handling(handler):
+            with COMMAND_SECONDS.time(command=name):
+                if spec is None:
+                    await self._unknown_command()
+                else:
+                    await self._process(spec)
+
+    async def _process(self, spec: "CommandSpec"):
+        """Check the sender's permissions, then run the command's handler"""
+        user = User(self.roster, self.config, self.event.sender)
         self.user = user
 
         if self.user.role == "Unknown":
@@ -88,88 +155,14 @@ class Command:
             )
             return
 
-        """Process the command"""
-        if self.command.startswith("echo"):
-            await self._echo()
-
-        elif self.command.startswith("react"):
-            await self._react()
-
-        elif self.command.startswith("help"):
-            await self._show_help()
-
-        elif self.command.startswith("info"):
-            await self._show_info()
-
-        elif self.command.startswith("poll"):
-            if not self.user.is_tc():
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only HTC can use this command."
-                )
-                return
-
-            await self._manage_poll()
-
-        elif self.command.startswith("vote"):
-            if not self.user.is_leader():
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only Team Leader and Deputy Leader can use this command."
-                )
-                return
-
-            if self.user.team == "IOI":
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Sorry, you are not allowed to vote."
-                )
-                return
-
-            await self._vote()
-
-        elif self.command.startswith("invite"):
-            if not self.user.is_tc():
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only HTC can use this command."
-                )
-                return
-
-            await self.invite()
-
-        elif self.command.startswith("accounts"):
-            if not self.user.is_leader():
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only Team Leader and Deputy Leader can use this command."
-                )
-                return
-
-            await self._show_accounts()
-
-        elif self.command.startswith("dropbox"):
-            if not self.user.is_leader():
-                await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only Team Leader and Deputy Leader can use this command."
-                )
-                return
-
-            await self._get_dropbox()
-
-        elif self.command.startswith("token"):
-            if not self.user.is_leader():
+        for permission in spec.permissions:
+            if not permission.check(self.user):
                 await send_text_to_room(
-                    self.client, self.room.room_id,
-                    "Only Team Leader and Deputy Leader can use this command."
+                    self.client, self.room.room_id, permission.denied
                 )
                 return
 
-            await self._get_token()
-
-        else:
-            await self._unknown_command()
+        await spec.handler(self)
 
     async def _echo(self):
         """Echo back the command's arguments"""
@@ -191,14 +184,13 @@ class Command:
         )
 
     async def _show_help(self):
-        """Show the help text"""
+        """Show the help text, listing the commands the user can use"""
 
         text = ""
         text += "Hello, I am IOI 2022 bot. I understand several commands:  \n\n"
-        text += "- `info`: shows various team information\n"
-        text += "- `accounts`: shows various accounts for your team\n"
-        text += "- `dropbox`: shows Dropbox upload links for your team\n"
-        text += "- `vote`: casts vote for your team\n"
+        for name, spec in COMMANDS.items():
+            if spec.usage and all(p.check(self.user) for p in spec.permissions):
+                text += f"- `{name}`: {spec.usage}\n"
 
         await send_text_to_room(self.client, self.room.room_id, text)
 
@@ -216,74 +208,97 @@ class Command:
             return
 
         teamcode = self.args[0].upper()
-        teams = self.store.teams
-        leaders = self.store.leaders
 
-        if teamcode in ['IC', 'SC', 'TC']:
-            rolecode = teamcode
-            roles = []
-            response = ""
+        def render():
+            text = self._render_info(teamcode)
+            return None if text is None else (text, render_markdown(text))
 
-            if rolecode == 'IC':
-                roles = ['President', 'Chair of IOI / IC Member', 'IC Member', 'Secretary', 'Treasurer']
-            if rolecode == 'SC':
-                roles = ['ISC Member', 'HSC', 'Invited HSC']
-            if rolecode == 'TC':
-                roles = ['ITC Member', 'HTC', 'Invited HTC']
+        # The listing only depends on the roster, so it is rendered once per roster
+        info = self.roster.info_for(teamcode, render)
+        if info is None:
+            await send_text_to_room(
+                self.client, self.room.room_id, f"Team {teamcode} not found!"
+            )
+            return
+
+        text, html = info
+        await send_text_to_room(
+            self.client, self.room.room_id, text, formatted_body=html
+        )
+
+    def _render_info(self, teamcode: str) -> Optional[str]:
+        """Render the members of a team or committee.
+
+        Returns:
+            The listing, or None if the team is not found.
+        """
+        teams = self.roster.teams
+        leaders = self.roster.leaders
+        homeserver_url = self.config.homeserver_url
+
+        if teamcode in COMMITTEE_ROLES:
+            roles = COMMITTEE_ROLES[teamcode]
+            members = leaders.loc[leaders['Role'].isin(roles)]
+            response = ""
 
             for idx, role in enumerate(roles):
                 if idx > 0:
                     response += "  \n  \n"
                 response += f"{role}:  \n"
-                for index, member in leaders.iterrows():
-                    if member['Role'] == role and member['Chair'] == 1:
-                        response += f"  \n- {make_pill(member['UserID'], self.config.homeserver_url)} (Chair) | {member['Name']}"
-                for index, member in leaders.iterrows():
-                    if member['Role'] == role and member['Chair'] != 1:
-                        response += f"  \n- {make_pill(member['UserID'], self.config.homeserver_url)} | {member['Name']}"
-
-            await send_text_to_room(self.client, self.room.room_id, response)
-            return
+
+                role_members = members.loc[members['Role'] == role]
+                is_chair = role_members['Chair'] == 1
+                for user_id, name in zip(
+                    role_members.loc[is_chair, 'UserID'], role_members.loc[is_chair, 'Name']
+                ):
+                    response += f"  \n- {make_pill(user_id, homeserver_url)} (Chair) | {name}"
+                for user_id, name in zip(
+                    role_members.loc[~is_chair, 'UserID'], role_members.loc[~is_chair, 'Name']
+                ):
+                    response += f"  \n- {make_pill(user_id, homeserver_url)} | {name}"
+
+            return response
 
         team = teams.loc[(teams['Code'] == teamcode) & (teams['Visible'] == 1)]
 
         if team.empty:
-            text = (
-                f"Team {teamcode} not found!"
-            )
-            await send_text_to_room(self.client, self.room.room_id, text)
-            return
+            return None
 
         response = f"""Team members from {teamcode}
         ({team.iloc[0]['Name']}):"""
 
-        curteam = leaders.loc[leaders['TeamCode'] == teamcode]
+        curteam = leaders.loc[
+            (leaders['TeamCode'] == teamcode) & leaders['UserID'].notna()
+        ]
 
-        roles = []
-        for index, member in curteam.iterrows():
-            role = member['Role']
-            userID = member['UserID']
-            if role not in roles and role in ['Team Leader', 'Deputy Leader', 'Guest', 'Remote Adjunct (not on site)', 'Invited Observer/Guest'] and exists(userID):
-                roles.append(role)
+        # roles are listed in order of first appearance
+        for role in curteam['Role'].drop_duplicates():
+            if role not in TEAM_ROLES:
+                continue
 
-        for role in roles:
             response += f"  \n  \n{role}: \n"
-            for index, member in curteam.iterrows():
-                if member['Role'] == role and exists(member['UserID']):
-                    response += f"  \n- {make_pill(member['UserID'], self.config.homeserver_url)} | {member['Name']}"
+            role_members = curteam.loc[curteam['Role'] == role]
+            for user_id, name in zip(role_members['UserID'], role_members['Name']):
+                response += f"  \n- {make_pill(user_id, homeserver_url)} | {name}"
 
         response += "  \n  \nContestants:  \n"
-        for index, row in self.store.contestants.iterrows():
-            if row['ContestantCode'].startswith(teamcode):
-                response += f"  \n- `{row['ContestantCode']}`"
-                if row['Online'] == 1:
-                    response += " (online)"
-                response += f" | {row['FirstName']} {row['LastName']}"
-
-        await send_text_to_room(self.client, self.room.room_id, response)
+        contestants = self.roster.contestants
+        contestants = contestants.loc[
+            contestants['ContestantCode'].str.startswith(teamcode, na=False)
+        ]
+        for code, online, first_name, last_name in zip(
+            contestants['ContestantCode'], contestants['Online'],
+            contestants['FirstName'], contestants['LastName']
+        ):
+            response += f"  \n- `{code}`"
+            if online == 1:
+                response += " (online)"
+            response += f" | {first_name} {last_name}"
+
+        return response
 
     async def _manage_poll(self):
-        cursor = self.store.vconn.cursor()
+        db = self.store.vdb
 
         if not self.args:
             text = (
@@ -314,11 +329,11 @@ class Command:
                 )
                 return
 
-            cursor.execute(
-                '''INSERT INTO polls (question, choices, active) VALUES (?, ?, 0)''',
+            # RETURNING instead of lastrowid, which postgres does not report
+            [poll_id] = await db.fetchone(
+                '''INSERT INTO polls (question, choices, active) VALUES (?, ?, 0) RETURNING poll_id''',
                 [input_poll[0], input_poll[1]]
             )
-            poll_id = cursor.lastrowid
 
             await send_text_to_room(
                 self.client, self.room.room_id,
@@ -355,11 +370,11 @@ class Command:
                 )
                 return
 
-            cursor.execute(
+            result = await db.execute(
                 '''UPDATE polls SET question = ?, choices = ? WHERE poll_id = ?''',
                 [input_poll[0], input_poll[1], poll_id]
             )
-            id_exist = cursor.execute('''SELECT changes()''').fetchall()[0][0]
+            id_exist = result.rowcount
 
             if not id_exist:
                 await send_text_to_room(
@@ -368,16 +383,22 @@ class Command:
                 )
                 return
 
+            active_poll = await self.store.active_poll.get()
+            if active_poll is not None and active_poll.poll_id == poll_id:
+                self.store.active_poll.set(
+                    ActivePoll.from_row(poll_id, input_poll[0], input_poll[1])
+                )
+            self.store.poll_events.poll_changed(poll_id)
+
             await send_text_to_room(
                 self.client, self.room.room_id,
                 f"Poll {poll_id} updated.  \n"
             )
 
         elif self.args[0].lower() == 'list':
-            cursor.execute(
+            poll_list = await db.fetchall(
                 '''SELECT poll_id, question, choices, active FROM polls'''
             )
-            poll_list = cursor.fetchall()
 
             if not poll_list:
                 await send_text_to_room(
@@ -419,56 +440,63 @@ class Command:
                 )
                 return
 
-            cursor.execute(
-                '''SELECT poll_id FROM polls WHERE poll_id = ?''',
+            poll_detail = await db.fetchone(
+                '''SELECT poll_id, question, choices FROM polls WHERE poll_id = ?''',
                 [poll_id]
             )
-            id_exist = cursor.fetchall()
 
-            if not id_exist:
+            if not poll_detail:
                 await send_text_to_room(
                     self.client, self.room.room_id,
                     f"Poll {poll_id} does not exist.  \n"
                 )
                 return
 
-            cursor.execute(
-                '''SELECT poll_id FROM polls WHERE active = 1'''
-            )
-            active_exist = cursor.fetchall()
+            active_poll = await self.store.active_poll.get()
 
-            if active_exist:
+            if active_poll is not None:
                 await send_text_to_room(
                     self.client, self.room.room_id,
-                    f"Poll {active_exist[0][0]} is already active. Only one poll can be active at any time.  \n"
+                    f"Poll {active_poll.poll_id} is already active. Only one poll can be active at any time.  \n"
                 )
                 return
 
-            cursor.execute(
-                '''UPDATE polls SET active = 1 WHERE poll_id = ?''',
+            # the partial unique index on polls(active) rejects a second active poll,
+            # so don't even try if one was activated in the meantime
+            result = await db.execute(
+                '''
+                UPDATE polls SET active = 1
+                WHERE poll_id = ? AND NOT EXISTS (SELECT 1 FROM polls WHERE active = 1)
+                ''',
                 [poll_id]
             )
 
-            cursor.execute(
-                '''SELECT question, choices FROM polls WHERE poll_id = ?''',
-                [poll_id]
-            )
-            active_poll = cursor.fetchall()
+            if not result.rowcount:
+                await send_text_to_room(
+                    self.client, self.room.room_id,
+                    "Another poll is already active. Only one poll can be active at any time.  \n"
+                )
+                return
+
+            active_poll = ActivePoll.from_row(*poll_detail)
+            self.store.active_poll.set(active_poll)
+            self.store.poll_events.poll_changed(poll_id)
 
-            options = active_poll[0][1].split('/')
-            options = '/'.join(("`"+option+"`") for option in options)
+            options = '/'.join(("`"+option+"`") for option in active_poll.choices)
 
             text = (
                 f"Active poll is now poll {poll_id}:  \n"
-                f'&emsp;&ensp;"{active_poll[0][0]}"  \n'
+                f'&emsp;&ensp;"{active_poll.question}"  \n'
                 f"&emsp;&ensp;{options}  \n"
             )
             await send_text_to_room(self.client, self.room.room_id, text)
 
         elif self.args[0] == 'deactivate':
-            cursor.execute(
+            await db.execute(
                 '''UPDATE polls SET active = 0 WHERE active = 1'''
             )
+            self.store.active_poll.set(None)
+            self.store.poll_events.poll_changed()
 
             await send_text_to_room(
                 self.client, self.room.room_id,
@@ -482,24 +510,18 @@ class Command:
             )
 
     async def _vote(self):
-        cursor = self.store.vconn.cursor()
-
-        cursor.execute(
-            '''SELECT poll_id, question, choices FROM polls WHERE active = 1'''
-        )
-        active_poll = cursor.fetchall()
+        active_poll = await self.store.active_poll.get()
 
-        if not active_poll:
+        if active_poll is None:
             await send_text_to_room(
                 self.client, self.room.room_id,
                 "There is no active poll to vote!  \n"
             )
             return
 
-        active_poll = active_poll[0]
-        poll_id  = active_poll[0]
-        question = active_poll[1]
-        choices  = active_poll[2].split('/')
+        poll_id  = active_poll.poll_id
+        question = active_poll.question
+        choices  = active_poll.choices
 
         if not self.args:
             text  = f'Question: "{question}"  \n\n'
@@ -510,9 +532,23 @@ class Command:
 
             await send_text_to_room(self.client, self.room.room_id, text)
 
-        elif ' '.join(self.args) in choices:
+        elif ' '.join(self.args) in active_poll.valid_choices:
             self.args = ' '.join(self.args)
 
+            # only confirm once the vote has been committed
+            try:
+                await self.store.votes.submit(
+                    poll_id, self.user.team, self.user.country,
+                    self.args, self.user.username
+                )
+            except Exception:
+                logger.exception("Unable to record vote of %s", self.user.username)
+                await send_text_to_room(
+                    self.client, self.room.room_id,
+                    "Sorry, your vote could not be recorded. Please resend your vote.  \n"
+                )
+                return
+
             text = (
                 f'Question: "{question}"  \n\n'
                 f"You voted `{self.args}` on behalf of the {self.user.country} team."
@@ -522,16 +558,6 @@ class Command:
             )
             await send_text_to_room(self.client, self.room.room_id, text)
 
-            cursor.execute(
-                '''
-                INSERT INTO votes (poll_id, team_code, choice, voted_by, voted_at)
-                VALUES (?, ?, ?, ?, datetime("now", "localtime"))
-                ON CONFLICT(poll_id, team_code) DO UPDATE
-                SET choice = excluded.choice, voted_by = excluded.voted_by, voted_at = datetime("now", "localtime")
-                ''',
-                [poll_id, self.user.team, self.args, self.user.username]
-            )
-
         else:
             text  = "Your vote is invalid.  \n\n"
             text += "Vote by sending one of:  \n\n"
@@ -546,6 +572,7 @@ class Command:
             text = (
                 "Usage:"
                 "  \n`invite <role> <room id>`: Invite all accounts with role to room"
+                "  \n`invite resume <room id>`: Retry the accounts left by an interrupted or failed invite"
                 "  \n  \nExamples:"
                 "  \n- `invite translators !egvUrNsxzCYFUtUmEJ:matrix.ioi2022.id`"
                 "  \n- `invite online !egvUrNsxzCYFUtUmEJ:matrix.ioi2022.id`"
@@ -554,38 +581,86 @@ class Command:
             return
 
 
-        if self.args[0].lower() == 'translators':
-            for index, acc in self.store.leaders.iterrows():
-                if acc['Matrix Exists'] == 'Y':
-                    if ((acc['Role'] == 'Guest' or acc['Role'] == 'Remote Adjunct (not on site)')
-                        and acc['Translating'] == 0
-                    ):
-                        continue
-
-                    await self.client.room_invite(
-                        self.args[1],
-                        f"@{acc['UserID']}:{self.config.homeserver_url[8:]}"
-                    )
-                    await asyncio.sleep(0.25)
-                    
-        elif self.args[0].lower() == 'online':
-            online_countries = set()
-            for index, acc in self.store.contestants.iterrows():
-                if acc['Online'] == 1:
-                    online_countries.add(acc['RealTeamCode'])
-
-            leaders = self.store.leaders
-            for country in online_countries:
-                leader_accounts = leaders[leaders['RealTeamCode'] == country]
-                for index, acc in leader_accounts.iterrows():
-                    if acc['Matrix Exists'] == 'Y':
-                        await self.client.room_invite(
-                            self.args[1],
-                            f"@{acc['UserID']}:{self.config.homeserver_url[8:]}"
-                        )
-                        await asyncio.sleep(0.25)
-
-        await send_text_to_room(self.client, self.room.room_id, "Successfully invited!")
+        if len(self.args) < 2:
+            await send_text_to_room(
+                self.client, self.room.room_id,
+                "Command format is invalid. Send `invite` to see all commands."
+            )
+            return
+
+        role = self.args[0].lower()
+        room_id = self.args[1]
+        homeserver = self.config.homeserver_url[8:]
+        inviter = BulkInviter(
+            self.client, os.path.join(self.config.store_path, "invites.json")
+        )
+
+        if role == 'translators':
+            leaders = self.roster.leaders
+            accounts = leaders.loc[
+                (leaders['Matrix Exists'] == 'Y')
+                & ~(
+                    leaders['Role'].isin(['Guest', 'Remote Adjunct (not on site)'])
+                    & (leaders['Translating'] == 0)
+                ),
+                'UserID'
+            ]
+            user_ids = [f"@{user_id}:{homeserver}" for user_id in accounts]
+
+        elif role == 'online':
+            contestants = self.roster.contestants
+            online_countries = set(
+                contestants.loc[contestants['Online'] == 1, 'RealTeamCode']
+            )
+
+            leaders = self.roster.leaders
+            accounts = leaders.loc[
+                leaders['RealTeamCode'].isin(online_countries)
+                & (leaders['Matrix Exists'] == 'Y'),
+                'UserID'
+            ]
+            user_ids = [f"@{user_id}:{homeserver}" for user_id in accounts]
+
+        elif role == 'resume':
+            user_ids = inviter.pending(room_id)
+            if not user_ids:
+                await send_text_to_room(
+                    self.client, self.room.room_id,
+                    f"There is no interrupted invite to resume for {room_id}."
+                )
+                return
+
+        else:
+            await send_text_to_room(
+                self.client, self.room.room_id,
+                "Command format is invalid. Send `invite` to see all commands."
+            )
+            return
+
+        await send_text_to_room(
+            self.client, self.room.room_id,
+            f"Inviting {len(user_ids)} accounts to {room_id}..."
+        )
+
+        async def progress(report):
+            await send_text_to_room(
+                self.client, self.room.room_id,
+                f"Invited {report.done}/{report.total} accounts..."
+            )
+
+        report = await inviter.invite(room_id, user_ids, progress)
+
+        text = (
+            f"Invited {len(report.invited)} accounts to {room_id}"
+            f" ({len(report.skipped)} already in the room, {len(report.failed)} failed)."
+        )
+        if report.failed:
+            text += "  \n  \nFailed invites:  \n"
+            for user_id, error in report.failed.items():
+                text += f"  \n- `{user_id}`: {error}"
+            text += f"  \n  \nSend `invite resume {room_id}` to retry them."
+
+        await send_text_to_room(self.client, self.room.room_id, text)
 
     async def _show_accounts(self):
         if not self.args:
@@ -602,7 +677,7 @@ class Command:
         team_country = self.user.country
 
         if self.args[0].lower() == 'contest':
-            contestants = self.store.contestants
+            contestants = self.roster.contestants
             real_team_code = self.user.real_team
             accounts = contestants.loc[contestants['RealTeamCode'] == real_team_code]
 
@@ -632,7 +707,7 @@ class Command:
 
 
         elif self.args[0].lower() == 'translation':
-            translation = self.store.translation_acc
+            translation = self.roster.translation_acc
             account = translation.loc[translation['TeamCode'] == team_code]
 
             if account.empty:
@@ -648,7 +723,7 @@ class Command:
             await send_text_to_room(self.client, self.room.room_id, text)
 
         elif self.args[0].lower() == 'early-practice':
-            testing = self.store.testing_acc
+            testing = self.roster.testing_acc
             real_team_code = self.user.real_team
             accounts = testing.loc[testing['RealTeamCode'] == real_team_code]
 
@@ -674,7 +749,7 @@ class Command:
             )
 
     async def _get_dropbox(self):
-        dropbox_link = self.store.dropbox_url
+        dropbox_link = self.roster.dropbox_url
         team_code = self.user.team
         real_team_code = self.user.real_team
         team_country = self.user.country
@@ -699,35 +774,25 @@ class Command:
         text = f"Dropbox upload link for Day {day} for team {team_code} ({team_country}):  \n\n"
         text += url + "  \n\n"
 
-        dbx = self.store.dbx
         try:
-            res = dbx.files_list_folder(f"/Uploads/Day {day}/{real_team_code}")
+            files = await self.store.dropbox.list_files(f"/Uploads/Day {day}/{real_team_code}")
         except Exception as e:
             await send_text_to_room(self.client, self.room.room_id, "No upload folder found.")
             return 
 
-        if not res.entries:
+        if not files:
             text += "The folder is empty. Please upload the required files through the link provided above."
             await send_text_to_room(self.client, self.room.room_id, text)
             return
 
         text += "List of successfully uploaded files:  \n"
-
-        def list_directory(dbx, path, prefix):
-            nonlocal text
-            res = dbx.files_list_folder(path)
-            for entry in res.entries:
-                if (isinstance(entry, dropbox.files.FolderMetadata)):
-                    list_directory(dbx, path + "/" + entry.name, prefix + entry.name + "/")
-                else:
-                    text += f"- `{prefix}{entry.name}`  \n"
-
-        list_directory(dbx, f"/Uploads/Day {day}/{real_team_code}", "")
+        for file in files:
+            text += f"- `{file}`  \n"
 
         await send_text_to_room(self.client, self.room.room_id, text)
 
     async def _get_token(self):
-        tokens = self.store.tokens
+        tokens = self.roster.tokens
         token = tokens.loc[tokens['TeamCode'] == self.user.team]
 
         if token.empty:
@@ -741,6 +806,61 @@ class Command:
                 f"Token for team {self.user.team}: `{token.iloc[0, 1]}`"
             )
 
+    async def _reload(self):
+        """Fetch the datasource sheets again"""
+        try:
+            roster = await self.store.refresh_roster()
+        except DatasourceError as e:
+            await send_text_to_room(
+                self.client, self.room.room_id,
+                f"Unable to reload the roster, keeping the current one: {e}"
+            )
+            return
+
+        await send_text_to_room(
+            self.client, self.room.room_id,
+            f"Roster reloaded: {len(roster.teams)} teams and {len(roster.users)} users."
+        )
+
+    async def _profile(self):
+        """Profile the event loop shared by the bot and the http server"""
+        if not self.args or self.args[0].lower() not in ["start", "stop"]:
+            text = (
+                "Usage:  \n\n"
+                "- `profile start`: start profiling the bot  \n"
+                "- `profile stop`: stop profiling, and show where the time went  \n"
+            )
+            await send_text_to_room(self.client, self.room.room_id, text)
+            return
+
+        if self.args[0].lower() == "start":
+            if not PROFILER.start():
+                text = "The bot is already being profiled."
+            else:
+                text = "Started profiling. Send `profile stop` to see the results."
+            await send_text_to_room(self.client, self.room.room_id, text)
+            return
+
+        if not PROFILER.running:
+            await send_text_to_room(
+                self.client, self.room.room_id,
+                "The bot is not being profiled. Send `profile start` first."
+            )
+            return
+
+        started_at = datetime.fromtimestamp(PROFILER.started_at)
+        path = os.path.join(
+            self.config.store_path, f"profile-{started_at:%Y%m%d-%H%M%S}.prof"
+        )
+        stats = PROFILER.stop(path)
+        logger.info("Saved the profile started at %s to %s", started_at, path)
+
+        await send_text_to_room(
+            self.client, self.room.room_id,
+            f"Profiled since {started_at:%H:%M:%S}, saved to `{path}`:\n\n"
+            f"```\n{stats.strip()}\n```"
+        )
+
     async def _unknown_command(self):
         await send_text_to_room(
             self.client,
@@ -749,5 +869,28 @@ class Command:
         )
 
 
-def exists(n):
-    return n == n
+# Maps each command to its handler, dispatched by exact match on the first word
+COMMANDS: Dict[str, CommandSpec] = {
+    "echo": CommandSpec(Command._echo, (), None),
+    "react": CommandSpec(Command._react, (), None),
+    "help": CommandSpec(Command._show_help, (), None),
+    "info": CommandSpec(Command._show_info, (), "shows various team information"),
+    "accounts": CommandSpec(
+        Command._show_accounts, (LEADER,), "shows various accounts for your team"
+    ),
+    "dropbox": CommandSpec(
+        Command._get_dropbox, (LEADER,), "shows Dropbox upload links for your team"
+    ),
+    "token": CommandSpec(Command._get_token, (LEADER,), "shows the token for your team"),
+    "vote": CommandSpec(Command._vote, (LEADER, VOTER), "casts vote for your team"),
+    "poll": CommandSpec(Command._manage_poll, (HTC,), "creates and activates polls"),
+    "invite": CommandSpec(
+        Command.invite, (HTC,), "invites all accounts with a role to a room"
+    ),
+    "reload": CommandSpec(
+        Command._reload, (HTC,), "reloads the roster from the datasource"
+    ),
+    "profile": CommandSpec(
+        Command._profile, (HTC,), "profiles the bot to find what slows it down"
+    ),
+}
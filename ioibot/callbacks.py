@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from nio import (
@@ -13,6 +14,7 @@ from nio import (
 
 from ioibot.bot_commands import Command
 from ioibot.chat_functions import make_pill, react_to_event, send_text_to_room
+from ioibot.command_pool import CommandPool
 from ioibot.config import Config
 from ioibot.message_responses import Message
 from ioibot.storage import Storage
@@ -35,6 +37,12 @@ class Callbacks:
         self.config = config
         self.command_prefix = config.command_prefix
 
+        # Commands run in the background, so that a slow one doesn't hold up the sync
+        self.commands = CommandPool(
+            concurrency=config.command_concurrency,
+            max_pending=config.command_max_pending,
+        )
+
     async def message(self, room: MatrixRoom, event: RoomMessageText) -> None:
         """Callback for when a message event is received
 
@@ -50,10 +58,12 @@ class Callbacks:
         if event.sender == self.client.user:
             return
 
-        logger.debug(
-            f"Bot message received for room {room.display_name} | "
-            f"{room.user_name(event.sender)}: {msg}"
-        )
+        # Looking up the display name isn't free, skip it unless it is logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Bot message received for room %s | %s: %s",
+                room.display_name, room.user_name(event.sender), msg,
+            )
 
         # Process as message if in a public room without command prefix
         has_command_prefix = msg.startswith(self.command_prefix)
@@ -75,7 +85,19 @@ class Callbacks:
             msg = msg[len(self.command_prefix) :]
 
         command = Command(self.client, self.store, self.config, msg, room, event)
-        await command.process()
+        if not self.commands.submit(event.sender, command.process):
+            logger.warning(
+                "Dropped command from %s, %d commands pending",
+                event.sender, self.commands.depth,
+            )
+            # Don't wait for the reply to be sent, which may be held up by rate limits
+            asyncio.ensure_future(
+                send_text_to_room(
+                    self.client,
+                    room.room_id,
+                    "The bot is busy right now, please try again in a moment.",
+                )
+            )
 
     async def invite(self, room: MatrixRoom, event: InviteMemberEvent) -> None:
         """Callback for when an invite is received. Join the room specified in the invite.
@@ -85,14 +107,15 @@ class Callbacks:
 
             event: The invite event.
         """
-        logger.debug(f"Got invite to {room.room_id} from {event.sender}.")
+        logger.debug("Got invite to %s from %s.", room.room_id, event.sender)
 
         # Attempt to join 3 times before giving up
         for attempt in range(3):
             result = await self.client.join(room.room_id)
             if type(result) == JoinError:
                 logger.error(
-                    f"Error joining room {room.room_id} (attempt %d): %s",
+                    "Error joining room %s (attempt %d): %s",
+                    room.room_id,
                     attempt,
                     result.message,
                 )
@@ -102,7 +125,7 @@ class Callbacks:
             logger.error("Unable to join room: %s", room.room_id)
 
         # Successfully joined room
-        logger.info(f"Joined {room.room_id}")
+        logger.info("Joined %s", room.room_id)
 
     async def invite_event_filtered_callback(
         self, room: MatrixRoom, event: InviteMemberEvent
@@ -129,7 +152,7 @@ class Callbacks:
 
             reacted_to_id: The event ID that the reaction points to.
         """
-        logger.debug(f"Got reaction to {room.room_id} from {event.sender}.")
+        logger.debug("Got reaction to %s from %s.", room.room_id, event.sender)
 
         # Get the original event that was reacted to
         event_response = await self.client.room_get_event(room.room_id, reacted_to_id)
@@ -168,13 +191,15 @@ class Callbacks:
             event: The encrypted event that we were unable to decrypt.
         """
         logger.error(
-            f"Failed to decrypt event '{event.event_id}' in room '{room.room_id}'!"
-            f"\n\n"
-            f"Tip: try using a different device ID in your config file and restart."
-            f"\n\n"
-            f"If all else fails, delete your store directory and let the bot recreate "
-            f"it (your reminders will NOT be deleted, but the bot may respond to existing "
-            f"commands a second time)."
+            "Failed to decrypt event '%s' in room '%s'!"
+            "\n\n"
+            "Tip: try using a different device ID in your config file and restart."
+            "\n\n"
+            "If all else fails, delete your store directory and let the bot recreate "
+            "it (your reminders will NOT be deleted, but the bot may respond to existing "
+            "commands a second time).",
+            event.event_id,
+            room.room_id,
         )
 
         red_x_and_lock_emoji = "❌ 🔐"
@@ -207,5 +232,6 @@ class Callbacks:
                 return
 
         logger.debug(
-            f"Got unknown event with type to {event.type} from {event.sender} in {room.room_id}."
+            "Got unknown event with type to %s from %s in %s.",
+            event.type, event.sender, room.room_id,
         )
@@ -1,7 +1,9 @@
 import logging
-from typing import Optional, Union
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from weakref import WeakKeyDictionary
 
-from markdown import markdown
+from markdown import Markdown
 from nio import (
     AsyncClient,
     ErrorResponse,
@@ -12,8 +14,43 @@ from nio import (
     SendRetryError,
 )
 
+from ioibot.metrics import Counter, Gauge
+from ioibot.outbound import OutboundQueue
+
 logger = logging.getLogger(__name__)
 
+MARKDOWN_CACHE_LOOKUPS = Counter(
+    "ioibot_markdown_cache_lookups_total",
+    "Lookups of rendered messages in the markdown cache, by whether they hit",
+    ["result"],
+)
+MARKDOWN_CACHE_SIZE = Gauge(
+    "ioibot_markdown_cache_size", "Number of rendered messages in the markdown cache"
+)
+
+# The outbound queue of each client, if it has one
+_outbound_queues: "WeakKeyDictionary[AsyncClient, OutboundQueue]" = WeakKeyDictionary()
+
+
+def set_outbound_queue(client: AsyncClient, queue: OutboundQueue) -> None:
+    """Route everything sent through this module by a client via an outbound queue"""
+    _outbound_queues[client] = queue
+
+
+async def _room_send(
+    client: AsyncClient, room_id: str, message_type: str, content: Dict[str, Any]
+) -> Union[Response, ErrorResponse]:
+    queue = _outbound_queues.get(client)
+    if queue is not None:
+        return await queue.send(room_id, message_type, content)
+
+    return await client.room_send(
+        room_id,
+        message_type,
+        content,
+        ignore_unverified_devices=True,
+    )
+
 
 async def send_text_to_room(
     client: AsyncClient,
@@ -22,6 +59,7 @@ async def send_text_to_room(
     notice: bool = True,
     markdown_convert: bool = True,
     reply_to_event_id: Optional[str] = None,
+    formatted_body: Optional[str] = None,
 ) -> Union[RoomSendResponse, ErrorResponse]:
     """Send text to a matrix room.
 
@@ -41,6 +79,9 @@ async def send_text_to_room(
         reply_to_event_id: Whether this message is a reply to another event. The event
             ID this is message is a reply to.
 
+        formatted_body: The already converted HTML of the message content, if any. Used
+            instead of converting the message content when markdown_convert is true.
+
     Returns:
         A RoomSendResponse if the request was successful, else an ErrorResponse.
     """
@@ -54,20 +95,76 @@ async def send_text_to_room(
     }
 
     if markdown_convert:
-        content["formatted_body"] = markdown(message)
+        if formatted_body is None:
+            formatted_body = render_markdown(message)
+        content["formatted_body"] = formatted_body
 
     if reply_to_event_id:
         content["m.relates_to"] = {"m.in_reply_to": {"event_id": reply_to_event_id}}
 
     try:
-        return await client.room_send(
-            room_id,
-            "m.room.message",
-            content,
-            ignore_unverified_devices=True,
-        )
+        return await _room_send(client, room_id, "m.room.message", content)
     except SendRetryError:
-        logger.exception(f"Unable to send message response to {room_id}")
+        logger.exception("Unable to send message response to %s", room_id)
+
+
+class MarkdownRenderer:
+    def __init__(self, max_size: int = 1024, max_length: int = 4096):
+        """Converts markdown to HTML with a single parser, remembering recent results.
+
+        Most of what the bot sends is the same templated text, so the HTML of the most
+        recently used messages is kept in an LRU cache.
+
+        Args:
+            max_size: The maximum number of messages kept in the cache.
+
+            max_length: Longer messages are converted, but not cached.
+        """
+        self.max_size = max_size
+        self.max_length = max_length
+        self.hits = 0
+        self.misses = 0
+
+        self._markdown = Markdown()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    def render(self, message: str) -> str:
+        html = self._cache.get(message)
+        if html is not None:
+            self.hits += 1
+            MARKDOWN_CACHE_LOOKUPS.inc(result="hit")
+            self._cache.move_to_end(message)
+            return html
+
+        self.misses += 1
+        MARKDOWN_CACHE_LOOKUPS.inc(result="miss")
+        html = self._markdown.reset().convert(message)
+
+        if len(message) <= self.max_length:
+            self._cache[message] = html
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+        return html
+
+    def stats(self) -> Dict[str, float]:
+        """The cache's hit and miss counts, its hit rate and its size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._cache),
+        }
+
+
+_markdown_renderer = MarkdownRenderer()
+MARKDOWN_CACHE_SIZE.set_function(lambda: len(_markdown_renderer._cache))
+
+
+def render_markdown(message: str) -> str:
+    """Convert markdown message content to HTML"""
+    return _markdown_renderer.render(message)
 
 
 def make_pill(user_id: str, homeserver_url: str, displayname: str = None) -> str:
@@ -120,12 +217,7 @@ async def react_to_event(
         }
     }
 
-    return await client.room_send(
-        room_id,
-        "m.reaction",
-        content,
-        ignore_unverified_devices=True,
-    )
+    return await _room_send(client, room_id, "m.reaction", content)
 
 
 async def decryption_failure(self, room: MatrixRoom, event: MegolmEvent) -> None:
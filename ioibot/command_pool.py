@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Deque, Dict
+
+from ioibot.keyed_queue import KeyedQueue
+from ioibot.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+COMMAND_WAIT_SECONDS = Histogram(
+    "ioibot_command_wait_seconds", "Time commands waited in the pool before starting"
+)
+
+
+class _Job:
+    def __init__(self, func: Callable[[], Awaitable[None]]):
+        self.func = func
+        self.queued_at = time.monotonic()
+
+
+class CommandPool:
+    def __init__(self, concurrency: int = 16, max_pending: int = 256):
+        """Runs commands outside of the sync loop's callbacks.
+
+        Commands of the same sender run one at a time, in the order they were received.
+        Commands of different senders run concurrently, up to `concurrency` at once.
+
+        Args:
+            concurrency: The maximum number of commands running at once.
+
+            max_pending: The maximum number of commands waiting or running. Further
+                commands are rejected until some have finished.
+        """
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._senders: KeyedQueue[_Job] = KeyedQueue(self._run_next)
+        self._pending = 0
+
+        # Time spent waiting before starting, over all started commands, in seconds
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        """The number of commands waiting or running"""
+        return self._pending
+
+    def submit(self, sender: str, func: Callable[[], Awaitable[None]]) -> bool:
+        """Queue a command to be run after the earlier commands of the same sender.
+
+        Args:
+            sender: The user who sent the command.
+
+            func: A function returning the coroutine that handles the command.
+
+        Returns:
+            Whether the command was queued, which it isn't if the pool is full.
+        """
+        if self._pending >= self.max_pending:
+            return False
+        self._pending += 1
+        self._senders.put(sender, _Job(func))
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and how long commands waited before they were started"""
+        return {
+            "depth": self._pending,
+            "started": self.wait_count,
+            "wait_avg": self.wait_total / self.wait_count if self.wait_count else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    async def _run_next(self, sender: str, pending: Deque[_Job]) -> None:
+        job = pending.popleft()
+        try:
+            async with self._semaphore:
+                self._record_wait(time.monotonic() - job.queued_at)
+                await job.func()
+        except Exception:
+            logger.exception("Error while handling a command from %s", sender)
+        finally:
+            self._pending -= 1
+
+    def _record_wait(self, wait: float) -> None:
+        self.wait_count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        COMMAND_WAIT_SECONDS.observe(wait)
@@ -1,4 +1,5 @@
 import logging
+import logging.handlers
 import os
 import re
 import sys
@@ -7,6 +8,7 @@ from typing import Any, List, Optional
 import yaml
 
 from ioibot.errors import ConfigError
+from ioibot.logs import TEXT_FORMAT, JsonFormatter, setup_logging
 
 logger = logging.getLogger()
 logging.getLogger("peewee").setLevel(
@@ -32,9 +34,13 @@ class Config:
     def _parse_config_values(self):
         """Read and validate each config option"""
         # Logging setup
-        formatter = logging.Formatter(
-            "%(asctime)s | %(name)s [%(levelname)s] %(message)s"
-        )
+        log_format = self._get_cfg(["logging", "format"], default="text")
+        if log_format == "json":
+            formatter = JsonFormatter()
+        elif log_format == "text":
+            formatter = logging.Formatter(TEXT_FORMAT)
+        else:
+            raise ConfigError("logging.format must be either 'text' or 'json'")
 
         log_level = self._get_cfg(["logging", "level"], default="INFO")
         logger.setLevel(log_level)
@@ -45,10 +51,23 @@ class Config:
         file_logging_filepath = self._get_cfg(
             ["logging", "file_logging", "filepath"], default="bot.log"
         )
+        # Rotated once the file reaches max_bytes, keeping backup_count old files
+        file_logging_max_bytes = self._get_cfg(
+            ["logging", "file_logging", "max_bytes"], default=10 * 1024 * 1024
+        )
+        file_logging_backup_count = self._get_cfg(
+            ["logging", "file_logging", "backup_count"], default=5
+        )
+
+        handlers = []
         if file_logging_enabled:
-            handler = logging.FileHandler(file_logging_filepath)
+            handler = logging.handlers.RotatingFileHandler(
+                file_logging_filepath,
+                maxBytes=file_logging_max_bytes,
+                backupCount=file_logging_backup_count,
+            )
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            handlers.append(handler)
 
         console_logging_enabled = self._get_cfg(
             ["logging", "console_logging", "enabled"], default=True
@@ -56,7 +75,10 @@ class Config:
         if console_logging_enabled:
             handler = logging.StreamHandler(sys.stdout)
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            handlers.append(handler)
+
+        # Written out from a thread, so that logging doesn't block the event loop
+        setup_logging(handlers)
 
         # Storage setup
         self.store_path = self._get_cfg(["storage", "store_path"], required=True)
@@ -103,14 +125,55 @@ class Config:
         )
         self.homeserver_url = self._get_cfg(["matrix", "homeserver_url"], required=True)
 
+        # Delays between attempts to reconnect to the homeserver, in seconds
+        self.reconnect_initial_delay = self._get_cfg(
+            ["matrix", "reconnect", "initial_delay"], default=1
+        )
+        self.reconnect_max_delay = self._get_cfg(
+            ["matrix", "reconnect", "max_delay"], default=300
+        )
+
         self.command_prefix = self._get_cfg(["command_prefix"], default="!c") + " "
 
+        # Outbound message queue
+        self.send_concurrency = self._get_cfg(["outbound", "concurrency"], default=8)
+        self.coalesce_notices = self._get_cfg(
+            ["outbound", "coalesce_notices"], default=False, required=False
+        )
+
+        # Commands being handled at once, and waiting or running before the bot
+        # answers that it is busy
+        self.command_concurrency = self._get_cfg(
+            ["commands", "concurrency"], default=16
+        )
+        self.command_max_pending = self._get_cfg(
+            ["commands", "max_pending"], default=256
+        )
+
+        # Debugging a blocked event loop. The watchdog reports whatever blocks the
+        # event loop for longer than its threshold, in seconds.
+        self.watchdog_enabled = self._get_cfg(
+            ["debug", "watchdog", "enabled"], default=False, required=False
+        )
+        self.watchdog_threshold = self._get_cfg(
+            ["debug", "watchdog", "threshold"], default=0.5
+        )
+        self.watchdog_interval = self._get_cfg(
+            ["debug", "watchdog", "interval"], default=0.1
+        )
+        self.profile_on_start = self._get_cfg(
+            ["debug", "profile"], default=False, required=False
+        )
+
         self.team_url = self._get_cfg(["datasource", "team_url"])
         self.leader_url = self._get_cfg(["datasource", "leader_url"])
         self.contestant_url = self._get_cfg(["datasource", "contestant_url"])
         self.testing_acc_url = self._get_cfg(["datasource", "testing_acc_url"])
         self.translation_acc_url = self._get_cfg(["datasource", "translation_acc_url"])
         self.token_url = self._get_cfg(["datasource", "token_url"])
+        self.refresh_interval = self._get_cfg(
+            ["datasource", "refresh_interval"], default=600
+        )
         
         # dropbox configuration
         self.dropbox_url = self._get_cfg(["datasource", "dropbox_url"])
@@ -118,6 +181,8 @@ class Config:
         self.db_refresh_token = self._get_cfg(["dropbox_credential", "refresh_token"])
         self.db_app_key = self._get_cfg(["dropbox_credential", "app_key"])
         self.db_app_secret = self._get_cfg(["dropbox_credential", "app_secret"])
+        self.db_cache_ttl = self._get_cfg(["dropbox", "cache_ttl"], default=30)
+        self.db_watch_path = self._get_cfg(["dropbox", "watch_path"], default="/Uploads")
 
     def _get_cfg(
         self,
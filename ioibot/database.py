@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence
+
+from ioibot.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = Histogram(
+    "ioibot_db_query_seconds",
+    "Time spent running database queries, excluding waiting for a connection",
+    ["operation"],
+)
+
+
+class QueryResult(NamedTuple):
+    """The outcome of a statement that does not return rows"""
+
+    rowcount: int
+    lastrowid: Optional[int]
+
+
+class Database:
+    def __init__(self, database_type: str, connection_string: str, pool_size: int = 4):
+        """A pool of database connections that can be used from the event loop.
+
+        Every query runs in a thread pool on a connection checked out of the pool, so
+        the event loop is never blocked on the database.
+
+        Args:
+            database_type: One of "sqlite" or "postgres".
+
+            connection_string: A string that can be fed to the respective db library's
+                `connect` method.
+
+            pool_size: The maximum number of open connections.
+        """
+        self.db_type = database_type
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="database"
+        )
+
+        if database_type == "sqlite":
+            self._pool = queue.Queue()
+            for _ in range(pool_size):
+                self._pool.put(self._connect_sqlite(connection_string))
+        elif database_type == "postgres":
+            from psycopg2.pool import ThreadedConnectionPool
+
+            self._pool = ThreadedConnectionPool(1, pool_size, connection_string)
+        else:
+            raise ValueError(f"Unknown database type '{database_type}'")
+
+    async def execute(self, query: str, params: Sequence[Any] = ()) -> QueryResult:
+        """Execute a statement that does not return rows.
+
+        Args:
+            query: The statement, with ? placeholders.
+
+            params: The values of the placeholders.
+
+        Returns:
+            The number of affected rows and the ID of the last inserted row.
+        """
+
+        def execute(cursor):
+            cursor.execute(query, params)
+            return QueryResult(cursor.rowcount, getattr(cursor, "lastrowid", None))
+
+        return await self._run(execute)
+
+    async def executemany(
+        self, query: str, params: Sequence[Sequence[Any]]
+    ) -> QueryResult:
+        """Execute a statement once for every set of parameters, in a single transaction.
+
+        Either every statement is committed, or none are.
+
+        Args:
+            query: The statement, with ? placeholders.
+
+            params: The values of the placeholders, one sequence per execution.
+
+        Returns:
+            The total number of affected rows.
+        """
+
+        def executemany(cursor):
+            cursor.executemany(query, params)
+            return QueryResult(cursor.rowcount, None)
+
+        return await self._run(executemany, transaction=True)
+
+    async def fetchone(self, query: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        """Execute a query and return its first row, or None if there are no rows"""
+
+        def fetchone(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+        return await self._run(fetchone)
+
+    async def fetchall(self, query: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """Execute a query and return all of its rows"""
+
+        def fetchall(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+        return await self._run(fetchall)
+
+    def _connect_sqlite(self, connection_string: str) -> Any:
+        import sqlite3
+
+        # Autocommit on. Connections are handed between the executor's threads, but are
+        # only ever used by one thread at a time.
+        conn = sqlite3.connect(
+            connection_string, isolation_level=None, check_same_thread=False
+        )
+
+        # Let readers proceed while a vote is being written. Voters are told their
+        # vote is recorded once it is committed, so commits must survive a power loss.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = FULL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn: Any) -> Iterator[None]:
+        """Commit everything executed in the block, or roll it all back on error"""
+        if self.db_type == "sqlite":
+            conn.execute("BEGIN")
+        else:
+            conn.autocommit = False
+
+        try:
+            yield
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            if self.db_type == "postgres":
+                conn.autocommit = True
+
+    @contextmanager
+    def _connection(self) -> Iterator[Any]:
+        """Check a connection out of the pool for the duration of the block"""
+        if self.db_type == "sqlite":
+            conn = self._pool.get()
+            try:
+                yield conn
+            finally:
+                self._pool.put(conn)
+        else:
+            conn = self._pool.getconn()
+            conn.autocommit = True
+            try:
+                yield conn
+            finally:
+                self._pool.putconn(conn)
+
+    def _call(self, func: Callable[[Any], Any], transaction: bool = False) -> Any:
+        """Call a function with a cursor on a pooled connection. Runs in the executor."""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                with DB_QUERY_SECONDS.time(operation=func.__name__):
+                    if not transaction:
+                        return func(_PlaceholderCursor(cursor, self.db_type))
+                    with self._transaction(conn):
+                        return func(_PlaceholderCursor(cursor, self.db_type))
+            finally:
+                cursor.close()
+
+    async def _run(self, func: Callable[[Any], Any], transaction: bool = False) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self._call, func, transaction)
+        )
+
+
+class _PlaceholderCursor:
+    def __init__(self, cursor: Any, db_type: str):
+        """A cursor that transforms placeholder ?'s to %s for postgres.
+
+        This allows for the support of queries that are compatible with both postgres and
+        sqlite.
+        """
+        self._cursor = cursor
+        self._db_type = db_type
+
+    def execute(self, query: str, params: Sequence[Any] = ()) -> None:
+        if self._db_type == "postgres":
+            query = query.replace("?", "%s")
+        self._cursor.execute(query, params)
+
+    def executemany(self, query: str, params: Sequence[Sequence[Any]]) -> None:
+        if self._db_type == "postgres":
+            query = query.replace("?", "%s")
+        self._cursor.executemany(query, params)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+import dropbox
+
+from ioibot.metrics import DEFAULT_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+DROPBOX_CALL_SECONDS = Histogram(
+    "ioibot_dropbox_call_seconds",
+    "Duration of Dropbox API calls, including the long-polls for changes",
+    ["call"],
+    buckets=DEFAULT_BUCKETS + (120, 300, 600),
+)
+
+
+class FolderListing:
+    def __init__(self, path: str):
+        """A cached recursive listing of a Dropbox folder.
+
+        Args:
+            path: The path of the listed folder.
+        """
+        self.path = path
+        self.cursor = None
+        self.fetched_at = float("-inf")
+
+        # Maps the lowercased path of each file to its path relative to the folder
+        self.files: Dict[str, str] = {}
+
+    def apply(self, entries: List[dropbox.files.Metadata]) -> None:
+        """Apply the entries of a (possibly incremental) listing result"""
+        prefix_length = len(self.path) + 1
+        for entry in entries:
+            if isinstance(entry, dropbox.files.FileMetadata):
+                self.files[entry.path_lower] = entry.path_display[prefix_length:]
+            elif isinstance(entry, dropbox.files.DeletedMetadata):
+                # A deleted folder takes all of its contents with it
+                deleted = entry.path_lower
+                self.files = {
+                    path: name
+                    for path, name in self.files.items()
+                    if path != deleted and not path.startswith(deleted + "/")
+                }
+
+    def copy(self) -> "FolderListing":
+        listing = FolderListing(self.path)
+        listing.cursor = self.cursor
+        listing.fetched_at = self.fetched_at
+        listing.files = dict(self.files)
+        return listing
+
+    def contains(self, path_lower: str) -> bool:
+        return path_lower.startswith(self.path.lower() + "/")
+
+
+class DropboxListing:
+    def __init__(self, dbx: dropbox.Dropbox, ttl: float, max_workers: int = 8):
+        """Lists Dropbox folders off the event loop, with a short-lived cache.
+
+        Listings are fetched recursively and paginated through
+        `files_list_folder_continue`. Once a listing is older than `ttl` seconds, it is
+        brought up to date incrementally from its cursor instead of being fetched again.
+
+        Args:
+            dbx: The Dropbox client.
+
+            ttl: The number of seconds a listing is served from the cache.
+
+            max_workers: The number of threads making Dropbox calls.
+        """
+        self.dbx = dbx
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dropbox"
+        )
+
+        self._listings: Dict[str, FolderListing] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def list_files(self, path: str) -> List[str]:
+        """List all files under a folder.
+
+        Args:
+            path: The path of the folder.
+
+        Returns:
+            The sorted paths of the files, relative to the folder.
+
+        Raises:
+            dropbox.exceptions.ApiError: If the folder could not be listed.
+        """
+        key = path.lower()
+        listing = self._listings.get(key)
+        if listing is not None and self._is_fresh(listing):
+            return sorted(listing.files.values())
+
+        # Let concurrent requests for the same folder share a single round-trip
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            listing = self._listings.get(key)
+            if listing is None or not self._is_fresh(listing):
+                try:
+                    listing = await self._run(self._fetch, path, listing)
+                except Exception:
+                    # Don't keep serving a listing that can't be brought up to date
+                    self._listings.pop(key, None)
+                    raise
+                self._listings[key] = listing
+
+        return sorted(listing.files.values())
+
+    async def watch(self, path: str, timeout: int = 480) -> None:
+        """Expire cached listings as soon as Dropbox reports a change under a folder.
+
+        Runs forever, long-polling a single recursive cursor for the whole folder so that
+        unchanged listings are not refreshed needlessly.
+
+        Args:
+            path: The folder to watch, usually the root of all upload folders.
+
+            timeout: The long-poll timeout in seconds, between 30 and 480.
+        """
+        cursor = None
+        while True:
+            try:
+                if cursor is None:
+                    result = await self._run(
+                        self.dbx.files_list_folder_get_latest_cursor,
+                        path,
+                        recursive=True,
+                    )
+                    cursor = result.cursor
+
+                result = await self._run(
+                    self.dbx.files_list_folder_longpoll, cursor, timeout
+                )
+                if result.changes:
+                    cursor = await self._run(self._expire_changed, cursor)
+                if result.backoff:
+                    await asyncio.sleep(result.backoff)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unable to watch Dropbox folder %s", path)
+                cursor = None
+                await asyncio.sleep(60)
+
+    def _is_fresh(self, listing: FolderListing) -> bool:
+        return time.monotonic() - listing.fetched_at < self.ttl
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking Dropbox call in the executor"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self._call, func, *args, **kwargs)
+        )
+
+    def _call(self, func, *args, **kwargs):
+        with DROPBOX_CALL_SECONDS.time(call=func.__name__):
+            return func(*args, **kwargs)
+
+    def _fetch(self, path: str, listing: Optional[FolderListing]) -> FolderListing:
+        """Fetch a listing from scratch, or catch up an existing one from its cursor.
+
+        Falls back to fetching from scratch if the cursor can't be continued, e.g.
+        because Dropbox has reset it. Called from the executor.
+        """
+        if listing is not None and listing.cursor is not None:
+            try:
+                # Catch up a copy, so that a failure halfway leaves the cached one alone
+                return self._paginate(
+                    listing.copy(), self.dbx.files_list_folder_continue, listing.cursor
+                )
+            except dropbox.exceptions.ApiError as e:
+                logger.warning(
+                    "Unable to catch up the listing of %s, listing it again: %s", path, e
+                )
+
+        return self._paginate(
+            FolderListing(path), self.dbx.files_list_folder, path, recursive=True
+        )
+
+    def _paginate(self, listing: FolderListing, func, *args, **kwargs) -> FolderListing:
+        """Apply a listing result and all of its further pages to a listing"""
+        fetched_at = time.monotonic()
+        result = func(*args, **kwargs)
+
+        listing.apply(result.entries)
+        while result.has_more:
+            result = self.dbx.files_list_folder_continue(result.cursor)
+            listing.apply(result.entries)
+
+        listing.cursor = result.cursor
+        listing.fetched_at = fetched_at
+        return listing
+
+    def _expire_changed(self, cursor: str) -> str:
+        """Expire the cached listings containing changed entries.
+
+        Called from the executor.
+
+        Returns:
+            The cursor to resume watching from.
+        """
+        changed = []
+        has_more = True
+        while has_more:
+            result = self.dbx.files_list_folder_continue(cursor)
+            changed.extend(entry.path_lower for entry in result.entries)
+            cursor = result.cursor
+            has_more = result.has_more
+
+        for listing in list(self._listings.values()):
+            if any(listing.contains(path) for path in changed):
+                listing.fetched_at = float("-inf")
+
+        return cursor
@@ -10,3 +10,14 @@ class ConfigError(RuntimeError):
 
     def __init__(self, msg: str):
         super(ConfigError, self).__init__("%s" % (msg,))
+
+
+class DatasourceError(RuntimeError):
+    """An error encountered while loading the datasource sheets.
+
+    Args:
+        msg: The message displayed to the user on error.
+    """
+
+    def __init__(self, msg: str):
+        super(DatasourceError, self).__init__("%s" % (msg,))
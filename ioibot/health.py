@@ -0,0 +1,88 @@
+import random
+import time
+from typing import Any, Dict, Optional
+
+
+class Backoff:
+    def __init__(
+        self,
+        initial_delay: float = 1,
+        max_delay: float = 300,
+        factor: float = 2,
+        jitter: float = 0.5,
+    ):
+        """Exponential backoff with jitter between reconnection attempts.
+
+        Args:
+            initial_delay: The delay before the first retry, in seconds.
+
+            max_delay: The longest delay, in seconds.
+
+            factor: How much the delay grows after every failed attempt.
+
+            jitter: The fraction of each delay that is randomized, so that many clients
+                do not all retry at the same moment.
+        """
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """The delay before the next attempt, in seconds"""
+        delay = min(self.max_delay, self.initial_delay * self.factor ** self.attempts)
+        self.attempts += 1
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+    def reset(self) -> None:
+        """Start over from the initial delay, after a successful attempt"""
+        self.attempts = 0
+
+
+class ConnectionHealth:
+    def __init__(self):
+        """The state of the connection to the homeserver, shared with the http server.
+
+        The state is one of "starting", "connected" or "reconnecting".
+        """
+        self.state = "starting"
+        self.since = time.time()
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.retry_at: Optional[float] = None
+        self.failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == "connected"
+
+    def synced(self) -> None:
+        """Record a successful sync with the homeserver"""
+        now = time.time()
+        if self.state != "connected":
+            self.state = "connected"
+            self.since = now
+            self.retry_at = None
+            self.failures = 0
+        self.last_sync = now
+
+    def disconnected(self, error: str, retry_in: float) -> None:
+        """Record a lost connection, which will be retried in `retry_in` seconds"""
+        now = time.time()
+        if self.state != "reconnecting":
+            self.state = "reconnecting"
+            self.since = now
+        self.last_error = error
+        self.retry_at = now + retry_in
+        self.failures += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "since": self.since,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+            "retry_at": self.retry_at,
+            "failures": self.failures,
+        }
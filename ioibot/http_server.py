@@ -1,64 +1,108 @@
-from aiohttp import web
 import asyncio
-import pandas as pd
-import sqlite3
-import yaml
+import json
+
+from aiohttp import web
+
+from ioibot.config import Config
+from ioibot.health import ConnectionHealth
+from ioibot.logs import request_scope
+from ioibot.metrics import REGISTRY
+from ioibot.storage import Storage
 
-async def create_app():
-	app = web.Application()
+# Seconds between comments sent on an idle results stream
+KEEPALIVE_INTERVAL = 15
+
+# tag the log records of every request with an ID of its own
+@web.middleware
+async def request_ids(request, handler):
+	with request_scope():
+		return await handler(request)
+
+async def create_app(config: Config, store: Storage, health: ConnectionHealth = None):
+	app = web.Application(middlewares=[request_ids])
 	routes = web.RouteTableDef()
-	conn = sqlite3.connect('ioibot.db')
-	cursor = conn.cursor()
-	with open("config.yaml", "r") as file_stream:
-		config = yaml.safe_load(file_stream)
-	teams = pd.read_csv(config['datasource']['team_url'])
+	results = store.poll_results
+	if health is None:
+		health = ConnectionHealth()
+
+	# state of the connection to the homeserver
+	@routes.get('/health')
+	async def health_status(request):
+		return web.json_response(health.to_dict(), status=200 if health.healthy else 503)
+
+	# metrics in the prometheus text format
+	@routes.get('/metrics')
+	async def metrics(request):
+		return web.Response(
+			body=REGISTRY.render().encode(),
+			headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+		)
 
 	# website
 	@routes.get('/polls')
 	async def home(request):
 		return web.FileResponse('./webpage/index.html')
 
+	def json_response(request, poll_result):
+		# idle screens revalidate with the last ETag they saw,
+		# and are only sent the result again once it has changed
+		if request.if_none_match and any(
+			etag.value in (poll_result.etag, '*') for etag in request.if_none_match
+		):
+			response = web.Response(status=304)
+		else:
+			response = web.Response(body=poll_result.body, content_type='application/json')
+
+		response.etag = poll_result.etag
+		response.headers['Cache-Control'] = 'no-cache'
+		return response
+
 	# return currently active poll result
 	@routes.get('/polls/active')
 	async def home(request):
-		cursor.execute(
-			'''SELECT poll_id, question FROM polls WHERE active = 1'''
-		)
-		poll_exist = cursor.fetchone()
+		return json_response(request, await results.active())
 
-		if not poll_exist:
-			result = {}
-			return web.json_response(result)
-		else:
-			# make sure that the json will return the question
-			# and list of countries with either 
-			# their choice / "none" if they haven't voted yet
-
-			[poll_id, question] = poll_exist
-			cursor.execute(
-				'''SELECT team_code, choice FROM votes WHERE poll_id = ?''',
-				[poll_id]
-			)
-			vote_result = cursor.fetchall()
-
-			result = {'question': question}
-			vote_result  = {
-				vote[0]:vote[1] 
-				for vote in vote_result
-			}
-
-			# show country name instead of country code for ease of use
-			votes = {}
-			for key, team in teams.iterrows():
-				if team['Voting'] == 0:
+	# push currently active poll result as server-sent events:
+	# a snapshot on connect and whenever the active poll changes,
+	# and a delta for every batch of votes committed in between
+	@routes.get('/polls/active/stream')
+	async def stream(request):
+		response = web.StreamResponse(headers={
+			'Content-Type': 'text/event-stream',
+			'Cache-Control': 'no-cache',
+		})
+		await response.prepare(request)
+
+		async def send(event, data):
+			payload = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+			await response.write(payload.encode())
+
+		events = store.poll_events.subscribe()
+		try:
+			snapshot = (await results.active()).result
+			await send('snapshot', snapshot)
+
+			while True:
+				try:
+					event, data = await asyncio.wait_for(events.get(), KEEPALIVE_INTERVAL)
+				except asyncio.TimeoutError:
+					# keep proxies from closing an idle connection
+					await response.write(b": keepalive\n\n")
 					continue
-				if team['Code'] in vote_result:
-					votes[team['Name']] = vote_result[team['Code']]
+
+				if event == 'votes':
+					votes = [vote for vote in data['votes'] if vote['poll_id'] == snapshot.get('poll_id')]
+					if votes:
+						await send('votes', votes)
 				else:
-					votes[team['Name']] = None
+					snapshot = (await results.active()).result
+					await send('snapshot', snapshot)
+		except ConnectionResetError:
+			pass
+		finally:
+			store.poll_events.unsubscribe(events)
 
-			result['votes'] = votes	
-			return web.json_response(result)
+		return response
 
 	# return poll result with specified poll_id
 	@routes.get('/polls/{pid}')
@@ -68,44 +112,36 @@ async def create_app():
 		except:
 			raise web.HTTPBadRequest()
 
-		cursor.execute(
-			'''SELECT poll_id, question FROM polls WHERE poll_id = ?''',
-			[poll_id]
-		)
-		poll_exist = cursor.fetchone()
-
-		if not poll_exist:
+		poll_result = await results.poll(poll_id)
+		if poll_result is None:
 			raise web.HTTPBadRequest()
+
+		return json_response(request, poll_result)
+
+	# return the number of votes for each choice of a poll,
+	# for screens that don't show the vote of every team
+	@routes.get('/polls/{pid}/summary')
+	async def api_poll_summary(request):
+		if request.match_info['pid'] == 'active':
+			key = 'active'
 		else:
-			[poll_id, question] = poll_exist
-			cursor.execute(
-				'''SELECT team_code, choice FROM votes WHERE poll_id = ?''',
-				[poll_id]
-			)
-			vote_result = cursor.fetchall()
-
-			result = {'question': question}
-			vote_result  = {
-				vote[0]:vote[1] 
-				for vote in vote_result
-			}
-
-			votes = {}
-			for key, team in teams.iterrows():
-				if team['Code'] in vote_result:
-					votes[team['Name']] = vote_result[team['Code']]
-				else:
-					votes[team['Name']] = None
+			try:
+				key = int(request.match_info['pid'])
+			except:
+				raise web.HTTPBadRequest()
+
+		poll_result = await results.summary(key)
+		if poll_result is None:
+			raise web.HTTPBadRequest()
+
+		return json_response(request, poll_result)
 
-			result['votes'] = votes	
-			return web.json_response(result)
-			
 	app.router.add_routes(routes)
 	app.router.add_static('/', './')
 	return app
 
-async def main():
-	app = await create_app()
+async def main(config: Config, store: Storage, health: ConnectionHealth = None):
+	app = await create_app(config, store, health)
 	runner = web.AppRunner(app)
 	await runner.setup()
 	site = web.TCPSite(runner, 'localhost', 9000)
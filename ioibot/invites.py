@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from nio import AsyncClient, JoinedMembersError, RoomInviteError
+
+from ioibot.rate_limit import RateLimit, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+
+class InviteReport:
+    def __init__(self, room_id: str, total: int):
+        """The outcome of a bulk invite.
+
+        Args:
+            room_id: The room users were invited to.
+
+            total: The number of users to invite.
+        """
+        self.room_id = room_id
+        self.total = total
+        self.invited: List[str] = []
+        self.skipped: List[str] = []
+        self.failed: Dict[str, str] = {}
+
+    @property
+    def done(self) -> int:
+        return len(self.invited) + len(self.skipped) + len(self.failed)
+
+
+class BulkInviter:
+    def __init__(
+        self,
+        client: AsyncClient,
+        state_path: str,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+    ):
+        """Invites many users to a room at once.
+
+        Invites are sent with bounded concurrency. When the homeserver answers with
+        M_LIMIT_EXCEEDED, every worker pauses for the requested `retry_after_ms`. Users
+        already in or invited to the room are skipped, and the users still pending are
+        persisted so that an interrupted run can be resumed.
+
+        Args:
+            client: The client to communicate to matrix with.
+
+            state_path: The JSON file holding the pending users of each room.
+
+            concurrency: The maximum number of invites in flight.
+
+            max_attempts: How many times a rate limited invite is attempted.
+        """
+        self.client = client
+        self.state_path = state_path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+        self._rate_limit = RateLimit()
+
+    def pending(self, room_id: str) -> List[str]:
+        """The users left to invite by an interrupted run for a room"""
+        return self._load_state().get(room_id, [])
+
+    async def invite(
+        self,
+        room_id: str,
+        user_ids: List[str],
+        progress: Optional[Callable[[InviteReport], Awaitable[None]]] = None,
+        progress_every: int = 100,
+    ) -> InviteReport:
+        """Invite users to a room.
+
+        Args:
+            room_id: The room to invite the users to.
+
+            user_ids: The MXIDs of the users.
+
+            progress: Called after every `progress_every` users are handled.
+
+            progress_every: How often to call `progress`.
+
+        Returns:
+            Which users were invited, skipped or failed to be invited (and why).
+        """
+        # Keep the order, but drop duplicates
+        user_ids = list(dict.fromkeys(user_ids))
+        report = InviteReport(room_id, len(user_ids))
+
+        pending = set(user_ids)
+        self._save_pending(room_id, pending)
+
+        members = await self._members(room_id)
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+
+        async def worker():
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                if user_id in members:
+                    report.skipped.append(user_id)
+                else:
+                    error = await self._invite(room_id, user_id)
+                    if error is None:
+                        report.invited.append(user_id)
+                    else:
+                        report.failed[user_id] = error
+
+                if user_id not in report.failed:
+                    pending.discard(user_id)
+
+                if report.done % progress_every == 0:
+                    self._save_pending(room_id, pending)
+                    if progress is not None:
+                        await progress(report)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        # Failed users are kept, so that they can be retried by resuming
+        self._save_pending(room_id, pending)
+
+        logger.info(
+            "Invited %d users to %s (%d skipped, %d failed)",
+            len(report.invited), room_id, len(report.skipped), len(report.failed),
+        )
+        return report
+
+    async def _members(self, room_id: str) -> Set[str]:
+        """The users who are already in or invited to a room"""
+        members = set()
+
+        room = self.client.rooms.get(room_id)
+        if room is not None:
+            members.update(room.users)
+            members.update(room.invited_users)
+
+        response = await self.client.joined_members(room_id)
+        if isinstance(response, JoinedMembersError):
+            logger.warning(
+                "Unable to get the members of %s: %s", room_id, response.message
+            )
+        else:
+            members.update(member.user_id for member in response.members)
+
+        return members
+
+    async def _invite(self, room_id: str, user_id: str) -> Optional[str]:
+        """Invite a single user, waiting out rate limits.
+
+        Returns:
+            None if the user was invited, else the reason why they were not.
+        """
+        for _ in range(self.max_attempts):
+            await self._rate_limit.wait()
+
+            response = await self.client.room_invite(room_id, user_id)
+            if not isinstance(response, RoomInviteError):
+                return None
+
+            if not is_rate_limited(response):
+                return response.message
+
+            # Make every worker back off, not just this one
+            retry_after_ms = self._rate_limit.pause(response)
+            logger.debug(
+                "Rate limited while inviting %s, retrying in %dms", user_id, retry_after_ms
+            )
+
+        return "Rate limited by the homeserver"
+
+    def _load_state(self) -> Dict[str, List[str]]:
+        if not os.path.isfile(self.state_path):
+            return {}
+
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.exception("Unable to read invite state from %s", self.state_path)
+            return {}
+
+    def _save_pending(self, room_id: str, pending: Set[str]) -> None:
+        state = self._load_state()
+        if pending:
+            state[room_id] = sorted(pending)
+        else:
+            state.pop(room_id, None)
+
+        try:
+            with open(self.state_path, "w") as f:
+                json.dump(state, f)
+        except OSError:
+            logger.exception("Unable to write invite state to %s", self.state_path)
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Generic, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class KeyedQueue(Generic[T]):
+    def __init__(self, drain: Callable[[Hashable, Deque[T]], Awaitable[None]]):
+        """Queues items per key, and handles each key's items in order.
+
+        A worker is started when the first item of a key is queued, and stops once the
+        key has no more pending items, so idle keys cost nothing. Workers of different
+        keys run concurrently.
+
+        Args:
+            drain: Takes one or more items off the front of a key's queue and handles
+                them. Called until the queue is empty. Anything it raises is logged.
+        """
+        self._drain = drain
+        self._queues: Dict[Hashable, Deque[T]] = {}
+
+    @property
+    def depth(self) -> int:
+        """The number of items waiting, over all keys"""
+        return sum(len(pending) for pending in self._queues.values())
+
+    def put(self, key: Hashable, item: T) -> None:
+        pending = self._queues.get(key)
+        if pending is None:
+            pending = self._queues[key] = deque()
+            asyncio.ensure_future(self._work(key, pending))
+        pending.append(item)
+
+    async def _work(self, key: Hashable, pending: Deque[T]) -> None:
+        try:
+            while pending:
+                try:
+                    await self._drain(key, pending)
+                except Exception:
+                    logger.exception("Error while handling the queue of %s", key)
+        finally:
+            del self._queues[key]
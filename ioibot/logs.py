@@ -0,0 +1,122 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, List, Optional
+
+from ioibot.watchdog import current_handler
+
+TEXT_FORMAT = "%(asctime)s | %(name)s [%(levelname)s] %(message)s"
+
+# The ID of the command or http request being handled, added to its log records
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Writes the queued records, if logging has been set up
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def request_scope(id: Optional[str] = None) -> Iterator[str]:
+    """Tag the log records of the block with a request ID, a new one if not given"""
+    if id is None:
+        id = uuid.uuid4().hex[:12]
+    token = request_id.set(id)
+    try:
+        yield id
+    finally:
+        request_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the request ID and the handled command of the current task to records.
+
+    Must run in the thread that logs, as the listener's thread doesn't see the context.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        handler = current_handler.get()
+        record.request_id = request_id.get()
+        record.command = handler.command if handler else None
+        record.room_id = handler.room_id if handler else None
+        record.sender = handler.sender if handler else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats every record as a line of JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ["request_id", "command", "room_id", "sender"]:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments into the message while they are still current, like
+        # QueueHandler, but keep the exception apart for the formatters
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(handlers: List[logging.Handler]) -> None:
+    """Send the root logger's records to the handlers, on a thread of their own.
+
+    Logging only puts the records in a queue, so that writing them out never blocks
+    the event loop. Replaces the handlers of an earlier call.
+    """
+    global _listener
+    stop_logging()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+
+    if not handlers:
+        return
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def stop_logging() -> None:
+    """Write out the records still in the queue, and stop the listener's thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
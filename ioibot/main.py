@@ -2,7 +2,7 @@
 import asyncio
 import logging
 import sys
-from time import sleep
+import time
 
 from aiohttp import ClientConnectionError, ServerDisconnectedError
 from nio import (
@@ -12,16 +12,76 @@ from nio import (
     LocalProtocolError,
     LoginError,
     MegolmEvent,
+    Response,
     RoomMessageText,
+    SyncResponse,
     UnknownEvent,
 )
 
+from ioibot import http_server
 from ioibot.callbacks import Callbacks
+from ioibot.chat_functions import set_outbound_queue
 from ioibot.config import Config
+from ioibot.health import Backoff, ConnectionHealth
+from ioibot.metrics import Gauge, Histogram
+from ioibot.outbound import OutboundQueue
 from ioibot.storage import Storage
+from ioibot.watchdog import PROFILER, LoopWatchdog
 
 logger = logging.getLogger(__name__)
 
+SYNC_SECONDS = Histogram(
+    "ioibot_sync_seconds",
+    "Duration of sync requests, including waiting for new events and handling them",
+)
+SYNC_HANDLING_SECONDS = Histogram(
+    "ioibot_sync_handling_seconds",
+    "Time spent handling sync responses, including the event callbacks",
+)
+QUEUE_DEPTH = Gauge(
+    "ioibot_queue_depth", "Number of items waiting in the bot's queues", ["queue"]
+)
+ROSTER_AGE_SECONDS = Gauge(
+    "ioibot_roster_age_seconds", "Time since the roster was downloaded"
+)
+
+# Only sync what the callbacks handle, plus the state needed to send to encrypted
+# rooms. Room members are lazy-loaded, nio fetches the full list before sharing keys.
+SYNC_FILTER = {
+    "presence": {"types": []},
+    "account_data": {"types": []},
+    "room": {
+        "account_data": {"types": []},
+        "ephemeral": {"types": []},
+        "state": {"lazy_load_members": True},
+        "timeline": {
+            "types": [
+                "m.room.message",
+                "m.room.encrypted",
+                "m.reaction",
+                "m.room.member",
+                "m.room.encryption",
+            ],
+            "lazy_load_members": True,
+        },
+    },
+}
+
+
+class InstrumentedClient(AsyncClient):
+    """An AsyncClient that records how long syncs take"""
+
+    async def sync(self, *args, **kwargs):
+        with SYNC_SECONDS.time():
+            return await super().sync(*args, **kwargs)
+
+    async def receive_response(self, response: Response) -> None:
+        if not isinstance(response, SyncResponse):
+            return await super().receive_response(response)
+
+        with SYNC_HANDLING_SECONDS.time():
+            return await super().receive_response(response)
+
 
 async def main():
     """The first function that is run when starting the bot"""
@@ -39,7 +99,26 @@ async def main():
     # Configure the database
     store = Storage(config.database, config)
 
-    # Configuration options for the AsyncClient
+    # Expire cached Dropbox listings as soon as teams upload something
+    asyncio.ensure_future(store.dropbox.watch(config.db_watch_path))
+
+    # Pick up roster changes without restarting
+    asyncio.ensure_future(store.refresh_roster_forever(config.refresh_interval))
+
+    # Catch whatever blocks the event loop shared by the bot and the http server
+    if config.watchdog_enabled:
+        LoopWatchdog(config.watchdog_threshold, config.watchdog_interval).start()
+    if config.profile_on_start:
+        PROFILER.start()
+
+    # Shared with the http server, which keeps serving while the bot reconnects
+    health = ConnectionHealth()
+
+    # Serve poll results from the same event loop and database pool as the bot
+    await http_server.main(config, store, health)
+
+    # Configuration options for the AsyncClient. Rate limited sends are not retried by
+    # nio, the outbound queue takes care of that.
     client_config = AsyncClientConfig(
         max_limit_exceeded=0,
         max_timeouts=0,
@@ -48,7 +127,7 @@ async def main():
     )
 
     # Initialize the matrix client
-    client = AsyncClient(
+    client = InstrumentedClient(
         config.homeserver_url,
         config.user_id,
         device_id=config.device_id,
@@ -60,8 +139,22 @@ async def main():
         client.access_token = config.user_token
         client.user_id = config.user_id
 
+    # Send replies through a rate-limit-aware queue, in order per room
+    outbound = OutboundQueue(
+        client,
+        concurrency=config.send_concurrency,
+        coalesce=config.coalesce_notices,
+    )
+    set_outbound_queue(client, outbound)
+
     # Set up event callbacks
     callbacks = Callbacks(client, store, config)
+
+    # Sampled whenever the metrics are scraped
+    QUEUE_DEPTH.set_function(lambda: outbound.depth, queue="outbound")
+    QUEUE_DEPTH.set_function(lambda: callbacks.commands.depth, queue="commands")
+    QUEUE_DEPTH.set_function(lambda: store.votes.depth, queue="votes")
+    ROSTER_AGE_SECONDS.set_function(lambda: time.time() - store.roster.fetched_at)
     client.add_event_callback(callbacks.message, (RoomMessageText,))
     client.add_event_callback(
         callbacks.invite_event_filtered_callback, (InviteMemberEvent,)
@@ -69,12 +162,25 @@ async def main():
     client.add_event_callback(callbacks.decryption_failure, (MegolmEvent,))
     client.add_event_callback(callbacks.unknown, (UnknownEvent,))
 
+    backoff = Backoff(
+        initial_delay=config.reconnect_initial_delay,
+        max_delay=config.reconnect_max_delay,
+    )
+
+    async def on_sync(response: SyncResponse) -> None:
+        health.synced()
+        backoff.reset()
+
+    client.add_response_callback(on_sync, (SyncResponse,))
+
     # Keep trying to reconnect on failure (with some time in-between)
     while True:
         try:
             if config.user_token:
-                # Use token to log in
-                client.load_store()
+                # Use token to log in. The store (and the sync token in it) only
+                # needs loading once, reconnects carry on from memory.
+                if client.olm is None:
+                    client.load_store()
 
                 # Sync encryption keys with the server
                 if client.should_upload_keys:
@@ -104,14 +210,28 @@ async def main():
 
                 # Login succeeded!
 
-            logger.info(f"Logged in as {config.user_id}")
-            await client.sync_forever(timeout=30000, full_state=True)
-
-        except (ClientConnectionError, ServerDisconnectedError):
-            logger.warning("Unable to connect to homeserver, retrying in 15s...")
-
-            # Sleep so we don't bombard the server with login requests
-            sleep(15)
+            logger.info("Logged in as %s", config.user_id)
+
+            # Resume from the last sync token, which nio keeps in memory across
+            # reconnects and persists in the store across restarts. Room state is
+            # not persisted, so it is requested in full until the first sync of this
+            # process has filled it in (without a token, the sync is full anyway).
+            await client.sync_forever(
+                timeout=30000,
+                sync_filter=SYNC_FILTER,
+                full_state=not client.rooms,
+            )
+
+        except (ClientConnectionError, ServerDisconnectedError) as e:
+            delay = backoff.next_delay()
+            health.disconnected(repr(e), delay)
+            logger.warning(
+                "Unable to connect to homeserver, retrying in %.1fs...", delay
+            )
+
+            # Sleep so we don't bombard the server with login requests, without
+            # blocking the http server running on the same loop
+            await asyncio.sleep(delay)
         finally:
             # Make sure to close the client connection on disconnect
             await client.close()
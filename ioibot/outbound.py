@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import Any, Deque, Dict, List
+
+from nio import AsyncClient, ErrorResponse, RoomSendError
+
+from ioibot.keyed_queue import KeyedQueue
+from ioibot.metrics import Counter, Histogram
+from ioibot.rate_limit import RateLimit, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+ROOM_SEND_SECONDS = Histogram(
+    "ioibot_room_send_seconds", "Duration of room_send requests to the homeserver"
+)
+ROOM_SEND_ERRORS = Counter(
+    "ioibot_room_send_errors_total",
+    "Failed room_send requests, by Matrix error code",
+    ["code"],
+)
+
+
+class _Outgoing:
+    def __init__(self, message_type: str, content: Dict[str, Any]):
+        self.message_type = message_type
+        self.content = content
+        self.future = asyncio.get_event_loop().create_future()
+
+    def can_coalesce(self, other: "_Outgoing") -> bool:
+        """Whether two messages can be merged into a single notice"""
+        return (
+            self.message_type == other.message_type == "m.room.message"
+            and self.content.get("msgtype") == other.content.get("msgtype") == "m.notice"
+            and "m.relates_to" not in self.content
+            and "m.relates_to" not in other.content
+            and ("formatted_body" in self.content) == ("formatted_body" in other.content)
+        )
+
+
+class OutboundQueue:
+    def __init__(
+        self,
+        client: AsyncClient,
+        concurrency: int = 8,
+        coalesce: bool = False,
+        max_attempts: int = 5,
+    ):
+        """A queue for everything the bot sends to rooms.
+
+        Messages to the same room are sent one at a time, in order. Sends to different
+        rooms run concurrently, up to `concurrency` at once. When the homeserver answers
+        with M_LIMIT_EXCEEDED, all sends pause for the requested `retry_after_ms`.
+
+        Args:
+            client: The client to communicate to matrix with.
+
+            concurrency: The maximum number of sends in flight.
+
+            coalesce: Whether notices waiting for the same room are merged into a single
+                message.
+
+            max_attempts: How many times a rate limited message is attempted.
+        """
+        self.client = client
+        self.coalesce = coalesce
+        self.max_attempts = max_attempts
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._rooms: KeyedQueue[_Outgoing] = KeyedQueue(self._send_next)
+        self._rate_limit = RateLimit()
+
+    @property
+    def depth(self) -> int:
+        """The number of messages waiting to be sent"""
+        return self._rooms.depth
+
+    async def send(self, room_id: str, message_type: str, content: Dict[str, Any]) -> Any:
+        """Queue an event to be sent to a room, and wait until it has been sent.
+
+        Args:
+            room_id: The ID of the room to send the event to.
+
+            message_type: The type of the event.
+
+            content: The content of the event.
+
+        Returns:
+            A RoomSendResponse if the request was successful, else an ErrorResponse.
+
+        Raises:
+            SendRetryError: If the event was unable to be sent.
+        """
+        outgoing = _Outgoing(message_type, content)
+        self._rooms.put(room_id, outgoing)
+        return await outgoing.future
+
+    async def _send_next(self, room_id: str, pending: Deque[_Outgoing]) -> None:
+        batch = [pending.popleft()]
+        while self.coalesce and pending and batch[0].can_coalesce(pending[0]):
+            batch.append(pending.popleft())
+
+        try:
+            response = await self._send(room_id, batch)
+        except Exception as e:
+            for outgoing in batch:
+                if not outgoing.future.done():
+                    outgoing.future.set_exception(e)
+        else:
+            for outgoing in batch:
+                if not outgoing.future.done():
+                    outgoing.future.set_result(response)
+
+    async def _send(self, room_id: str, batch: List[_Outgoing]) -> Any:
+        content = self._merge(batch)
+        message_type = batch[0].message_type
+
+        for _ in range(self.max_attempts):
+            await self._rate_limit.wait()
+
+            async with self._semaphore:
+                try:
+                    with ROOM_SEND_SECONDS.time():
+                        response = await self.client.room_send(
+                            room_id, message_type, content,
+                            ignore_unverified_devices=True,
+                        )
+                except Exception:
+                    ROOM_SEND_ERRORS.inc(code="exception")
+                    raise
+
+            if isinstance(response, ErrorResponse):
+                ROOM_SEND_ERRORS.inc(code=response.status_code or "unknown")
+
+            if not is_rate_limited(response):
+                if isinstance(response, RoomSendError):
+                    logger.error(
+                        "Unable to send message to %s: %s", room_id, response.message
+                    )
+                return response
+
+            # Hold back every room, not just this one
+            retry_after_ms = self._rate_limit.pause(response)
+            logger.warning(
+                "Rate limited while sending to %s, retrying in %dms",
+                room_id, retry_after_ms,
+            )
+
+        return response
+
+    def _merge(self, batch: List[_Outgoing]) -> Dict[str, Any]:
+        """Merge the content of coalesced notices"""
+        if len(batch) == 1:
+            return batch[0].content
+
+        content = dict(batch[0].content)
+        content["body"] = "\n\n".join(outgoing.content["body"] for outgoing in batch)
+        if "formatted_body" in content:
+            content["formatted_body"] = "\n".join(
+                outgoing.content["formatted_body"] for outgoing in batch
+            )
+        return content
@@ -0,0 +1,389 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from ioibot.database import Database
+
+logger = logging.getLogger(__name__)
+
+# The key of the cached result of the active poll
+ACTIVE = "active"
+
+
+class PollEvents:
+    def __init__(self, max_backlog: int = 256):
+        """Fans out changes to poll results to the subscribers of the live results stream.
+
+        Published events are one of:
+            * ("votes", {"votes": [{"poll_id", "team", "choice"}, ...]}): a batch of
+                votes was committed, in the order they were cast.
+            * ("poll", {"poll_id"}): a poll was activated, deactivated or updated, so
+                results must be reloaded. The poll ID is None when all polls were
+                deactivated.
+            * ("reset", {}): the subscriber fell behind, so results must be reloaded.
+
+        Args:
+            max_backlog: The number of undelivered events after which a subscriber is
+                asked to reload the results instead.
+        """
+        self.max_backlog = max_backlog
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Call a function with every event, before it is sent to any subscriber"""
+        self._listeners.append(listener)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Start receiving events. The returned queue yields `(event, data)` tuples."""
+        queue = asyncio.Queue(maxsize=self.max_backlog)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Send an event to every subscriber, without waiting for any of them"""
+        for listener in self._listeners:
+            listener(event, data)
+
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Drop the backlog of a slow subscriber, it will start over from a
+                # fresh snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("reset", {}))
+
+    def votes(self, votes: List[Dict[str, Any]]) -> None:
+        """Publish a batch of committed votes.
+
+        Args:
+            votes: The committed votes, each with the ID of the poll voted on, the name
+                of the team as shown in the results, and the chosen option.
+        """
+        self.publish("votes", {"votes": votes})
+
+    def poll_changed(self, poll_id: Optional[int] = None) -> None:
+        """Publish that a poll was activated, deactivated or updated.
+
+        Args:
+            poll_id: The ID of the changed poll, or None if all polls were deactivated.
+        """
+        self.publish("poll", {"poll_id": poll_id})
+
+
+class ActivePoll(NamedTuple):
+    """The poll that is currently open for voting"""
+
+    poll_id: int
+    question: str
+    # In the order they were given, for display
+    choices: Tuple[str, ...]
+    # For validating votes
+    valid_choices: FrozenSet[str]
+
+    @classmethod
+    def from_row(cls, poll_id: int, question: str, choices: str) -> "ActivePoll":
+        """Build the record from a row of the polls table"""
+        options = tuple(choices.split('/'))
+        return cls(poll_id, question, options, frozenset(options))
+
+
+class ActivePollCache:
+    def __init__(self, db: Database):
+        """The active poll, kept in memory so votes can be validated without a query.
+
+        It is read from the database once, and from then on it is kept up to date by
+        the commands that activate, deactivate and update polls.
+
+        Args:
+            db: The polls database.
+        """
+        self.db = db
+        self._poll: Optional[ActivePoll] = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Optional[ActivePoll]:
+        """The active poll, or None if no poll is active"""
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    row = await self.db.fetchone(
+                        '''SELECT poll_id, question, choices FROM polls WHERE active = 1'''
+                    )
+                    # don't overwrite a poll activated while the query ran
+                    if not self._loaded:
+                        self._poll = ActivePoll.from_row(*row) if row else None
+                        self._loaded = True
+        return self._poll
+
+    def set(self, poll: Optional[ActivePoll]) -> None:
+        """Record a newly activated or updated poll, or None after deactivating"""
+        self._poll = poll
+        self._loaded = True
+
+
+class PollTally:
+    def __init__(self, poll_id: int, question: str, choices: List[str], voters: Set[str]):
+        """Running per-choice counts of the votes on a poll.
+
+        Only votes of voting teams are counted.
+
+        Args:
+            poll_id: The ID of the poll.
+
+            question: The question of the poll.
+
+            choices: The choices of the poll, which are counted even without votes.
+
+            voters: The names of the voting teams.
+        """
+        self.poll_id = poll_id
+        self.question = question
+        self.voters = voters
+        self.votes: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {choice: 0 for choice in choices}
+
+    def apply(self, team: str, choice: str) -> None:
+        """Count a team's vote, moving it from its previous choice if it changed"""
+        if team not in self.voters:
+            return
+
+        previous = self.votes.get(team)
+        if previous == choice:
+            return
+        if previous is not None:
+            self.counts[previous] -= 1
+
+        self.counts[choice] = self.counts.get(choice, 0) + 1
+        self.votes[team] = choice
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'poll_id': self.poll_id,
+            'question': self.question,
+            'tally': dict(self.counts),
+            'voted': len(self.votes),
+            'total': len(self.voters),
+        }
+
+
+class PollResult(NamedTuple):
+    """A materialized poll result"""
+
+    version: int
+    result: Dict[str, Any]
+    body: bytes
+    etag: str
+
+
+class PollResults:
+    def __init__(self, store: Any, events: PollEvents):
+        """Materialized poll results, which are only rebuilt after a vote or poll change.
+
+        Every change bumps a monotonically increasing version, which is used in the
+        ETag of the results built after it. The version starts over in every process,
+        so the ETags also carry a token of the process.
+
+        Args:
+            store: Bot storage, holding the polls database and the roster.
+
+            events: Where votes and poll changes are published.
+        """
+        self.store = store
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self._results: Dict[Union[str, int], PollResult] = {}
+        self._tallies: Dict[int, PollTally] = {}
+
+        events.add_listener(self._on_event)
+
+    async def active(self) -> PollResult:
+        """The result of the active poll, with an empty result if there is none"""
+        return await self._get(ACTIVE)
+
+    async def poll(self, poll_id: int) -> Optional[PollResult]:
+        """The result of a poll, or None if the poll does not exist"""
+        return await self._get(poll_id)
+
+    async def summary(self, key: Union[str, int]) -> Optional[PollResult]:
+        """The per-choice counts of a poll's votes, without the vote of every team.
+
+        Args:
+            key: The ID of the poll, or `ACTIVE` for the active poll.
+
+        Returns:
+            The counts, which are empty if `ACTIVE` is given and there is no active
+            poll, or None if the poll does not exist.
+        """
+        version = self.version
+        if key == ACTIVE:
+            active_poll = await self.store.active_poll.get()
+            if active_poll is None:
+                etag = self._etag(f"summary-{key}", version)
+                return PollResult(version, {}, b'{}', etag)
+            poll_id = active_poll.poll_id
+        else:
+            poll_id = key
+
+        tally = self._tallies.get(poll_id)
+        if tally is None:
+            tally = await self._load_tally(poll_id)
+            if tally is None:
+                return None
+
+            # Votes that came in while loading were not applied, so don't keep it
+            if version == self.version:
+                self._tallies[poll_id] = tally
+
+        result = tally.to_dict()
+        body = json.dumps(result).encode()
+        return PollResult(version, result, body, self._etag(f"summary-{key}", version))
+
+    def invalidate(self, poll_id: Optional[int] = None) -> None:
+        """Drop the cached results of a poll and of the active poll.
+
+        Args:
+            poll_id: The ID of the changed poll, or None to only drop the active poll.
+        """
+        self.version += 1
+        self._results.pop(ACTIVE, None)
+        if poll_id is not None:
+            self._results.pop(poll_id, None)
+
+    def invalidate_all(self) -> None:
+        """Drop all cached results, e.g. after the teams have changed"""
+        self.version += 1
+        self._results.clear()
+        self._tallies.clear()
+
+    def _on_event(self, event: str, data: Dict[str, Any]) -> None:
+        if event == "votes":
+            for vote in data["votes"]:
+                tally = self._tallies.get(vote["poll_id"])
+                if tally is not None:
+                    tally.apply(vote["team"], vote["choice"])
+
+            for poll_id in {vote["poll_id"] for vote in data["votes"]}:
+                self.invalidate(poll_id)
+        elif event == "poll":
+            # The question or choices may have changed
+            self._tallies.pop(data["poll_id"], None)
+            self.invalidate(data["poll_id"])
+
+    async def _load_tally(self, poll_id: int) -> Optional[PollTally]:
+        db: Database = self.store.vdb
+        poll_exist = await db.fetchone(
+            '''SELECT question, choices FROM polls WHERE poll_id = ?''',
+            [poll_id]
+        )
+
+        if not poll_exist:
+            return None
+
+        vote_result = await db.fetchall(
+            '''SELECT team_code, choice FROM votes WHERE poll_id = ?''',
+            [poll_id]
+        )
+
+        roster = self.store.roster
+        team_names = dict(roster.team_names)
+
+        [question, choices] = poll_exist
+        tally = PollTally(
+            poll_id, question, choices.split('/'),
+            {name for _, name in roster.voting_team_names}
+        )
+        for code, choice in vote_result:
+            if code in team_names:
+                tally.apply(team_names[code], choice)
+        return tally
+
+    def _etag(self, key: Union[str, int], version: int) -> str:
+        return f"{self.epoch}-{key}-{version}"
+
+    async def _get(self, key: Union[str, int]) -> Optional[PollResult]:
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        version = self.version
+        if key == ACTIVE:
+            result = await self._build_active()
+        else:
+            result = await self._build(key)
+            if result is None:
+                return None
+
+        body = json.dumps(result).encode()
+        poll_result = PollResult(version, result, body, self._etag(key, version))
+
+        # Don't cache a result that was outdated while it was being built
+        if version == self.version:
+            self._results[key] = poll_result
+        return poll_result
+
+    async def _build_active(self) -> Dict[str, Any]:
+        active_poll = await self.store.active_poll.get()
+
+        if active_poll is None:
+            return {}
+
+        # make sure that the json will return the question
+        # and list of countries with either
+        # their choice / "none" if they haven't voted yet
+        return await self._assemble(
+            active_poll.poll_id, active_poll.question, voting_only=True
+        )
+
+    async def _build(self, poll_id: int) -> Optional[Dict[str, Any]]:
+        db: Database = self.store.vdb
+        poll_exist = await db.fetchone(
+            '''SELECT poll_id, question FROM polls WHERE poll_id = ?''',
+            [poll_id]
+        )
+
+        if not poll_exist:
+            return None
+
+        [poll_id, question] = poll_exist
+        return await self._assemble(poll_id, question, voting_only=False)
+
+    async def _assemble(
+        self, poll_id: int, question: str, voting_only: bool
+    ) -> Dict[str, Any]:
+        db: Database = self.store.vdb
+        vote_result = await db.fetchall(
+            '''SELECT team_code, choice FROM votes WHERE poll_id = ?''',
+            [poll_id]
+        )
+
+        vote_result = dict(vote_result)
+
+        # show country name instead of country code for ease of use
+        roster = self.store.roster
+        team_names = roster.voting_team_names if voting_only else roster.team_names
+
+        return {
+            'poll_id': poll_id,
+            'question': question,
+            'votes': {name: vote_result.get(code) for code, name in team_names},
+        }
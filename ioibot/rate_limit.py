@@ -0,0 +1,42 @@
+import asyncio
+import time
+from typing import Any
+
+from nio import ErrorResponse
+
+# Used when the homeserver rate limits us without saying for how long
+DEFAULT_RETRY_AFTER_MS = 5000
+
+
+def is_rate_limited(response: Any) -> bool:
+    """Whether a response is the homeserver's M_LIMIT_EXCEEDED"""
+    return (
+        isinstance(response, ErrorResponse)
+        and response.status_code == "M_LIMIT_EXCEEDED"
+    )
+
+
+class RateLimit:
+    def __init__(self):
+        """A pause of every request sharing it, after the homeserver rate limits one.
+
+        Holding back every request rather than just the limited one keeps the others
+        from being limited in turn.
+        """
+        self._resume_at = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the pause, if any, is over"""
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, response: ErrorResponse) -> int:
+        """Pause for as long as a rate limited response asks.
+
+        Returns:
+            The requested pause, in milliseconds.
+        """
+        retry_after_ms = response.retry_after_ms or DEFAULT_RETRY_AFTER_MS
+        self._resume_at = max(self._resume_at, time.monotonic() + retry_after_ms / 1000)
+        return retry_after_ms
@@ -0,0 +1,257 @@
+import io
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from ioibot.config import Config
+from ioibot.errors import DatasourceError
+
+logger = logging.getLogger(__name__)
+
+# The datasource sheets making up the roster, as
+# attribute name: (config option holding the sheet's URL, columns the bot relies on)
+DATASOURCES = {
+    "teams": ("team_url", ["Code", "Name", "Visible", "Voting"]),
+    "leaders": (
+        "leader_url",
+        ["UserID", "TeamCode", "RealTeamCode", "Name", "Role", "Chair",
+         "Matrix Exists", "Translating"],
+    ),
+    "contestants": (
+        "contestant_url",
+        ["ContestantCode", "RealTeamCode", "FirstName", "LastName", "Online", "Password"],
+    ),
+    "testing_acc": (
+        "testing_acc_url",
+        ["ContestantCode", "RealTeamCode", "FirstName", "LastName", "Password"],
+    ),
+    "translation_acc": ("translation_acc_url", ["TeamCode"]),
+    "tokens": ("token_url", ["TeamCode"]),
+    "dropbox_url": ("dropbox_url", ["RealTeamCode"]),
+}
+
+
+class RosterUser(NamedTuple):
+    """A compact record of a roster member, keyed by MXID in `Roster.users`"""
+
+    team: str
+    real_team: str
+    name: str
+    role: str
+    country: str
+
+
+class Roster:
+    def __init__(
+        self,
+        sheets: Dict[str, pd.DataFrame],
+        homeserver_url: str,
+        fetched_at: Optional[float] = None,
+        from_snapshot: bool = False,
+    ):
+        """An immutable snapshot of all datasource sheets.
+
+        A new snapshot is built on every refresh and swapped in as a whole, so a command
+        holding on to a snapshot never sees a half-updated roster. The sheets are never
+        modified, only listings derived from them are memoized, see `info_for`.
+
+        Args:
+            sheets: The sheets, keyed by their name in `DATASOURCES`.
+
+            homeserver_url: The URL of the homeserver the users' MXIDs belong to.
+
+            fetched_at: When the sheets were downloaded. Defaults to now.
+
+            from_snapshot: Whether the sheets were read from the local snapshot rather
+                than downloaded.
+        """
+        self.sheets = sheets
+        self.teams = sheets["teams"]
+        self.leaders = sheets["leaders"]
+        self.contestants = sheets["contestants"]
+        self.testing_acc = sheets["testing_acc"]
+        self.translation_acc = sheets["translation_acc"]
+        self.tokens = sheets["tokens"]
+        self.dropbox_url = sheets["dropbox_url"]
+
+        self.homeserver_url = homeserver_url
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.from_snapshot = from_snapshot
+        self.users = self._build_user_index()
+
+        # (code, name) of every team and of the voting teams, in sheet order, for
+        # assembling poll results
+        self.team_names = list(zip(self.teams['Code'], self.teams['Name']))
+        voting = self.teams[self.teams['Voting'] != 0]
+        self.voting_team_names = list(zip(voting['Code'], voting['Name']))
+
+        # Rendered `info` listings as (markdown, html), keyed by team or committee code.
+        # Filled lazily, and discarded along with the roster on refresh.
+        self._info: Dict[str, Tuple[str, str]] = {}
+
+    def info_for(
+        self, code: str, render: Callable[[], Optional[Tuple[str, str]]]
+    ) -> Optional[Tuple[str, str]]:
+        """The `info` listing of a team or committee, rendered once per roster.
+
+        Args:
+            code: The team or committee code.
+
+            render: Renders the listing as (markdown, html) from this roster, or
+                returns None if the code is not found, which is not remembered.
+        """
+        info = self._info.get(code)
+        if info is None:
+            info = render()
+            if info is not None:
+                self._info[code] = info
+        return info
+
+    def _build_user_index(self) -> Dict[str, RosterUser]:
+        """Index the leaders sheet by MXID so that users can be resolved in constant time.
+
+        Only the first row for each MXID is considered, and users whose team code is not
+        found in the teams sheet are left out of the index (and are thus unauthorized).
+
+        Returns:
+            A dictionary mapping each user's MXID to their roster record.
+        """
+        homeserver = self.homeserver_url[8:]
+        countries = dict(zip(self.teams['Code'], self.teams['Name']))
+        leaders = self.leaders
+
+        users = {}
+        for user_id, team, real_team, name, role in zip(
+            leaders['UserID'], leaders['TeamCode'], leaders['RealTeamCode'],
+            leaders['Name'], leaders['Role']
+        ):
+            # skip empty cells
+            if user_id != user_id:
+                continue
+
+            username = f"@{user_id}:{homeserver}"
+            if username in users:
+                continue
+
+            country = countries.get(team)
+            users[username] = None if country is None else RosterUser(
+                team, real_team, name, role, country
+            )
+
+        return {username: user for username, user in users.items() if user is not None}
+
+
+def fetch_sheets(config: Config) -> Dict[str, pd.DataFrame]:
+    """Download all datasource sheets concurrently.
+
+    Raises:
+        DatasourceError: If a sheet could not be downloaded or is missing columns.
+    """
+    with ThreadPoolExecutor(max_workers=len(DATASOURCES)) as executor:
+        futures = {
+            name: executor.submit(pd.read_csv, getattr(config, option))
+            for name, (option, _) in DATASOURCES.items()
+        }
+
+        sheets = {}
+        for name, future in futures.items():
+            try:
+                sheets[name] = future.result()
+            except Exception as e:
+                raise DatasourceError(f"Unable to fetch the {name} sheet: {e}")
+
+    validate_sheets(sheets)
+    return sheets
+
+
+def validate_sheets(sheets: Dict[str, pd.DataFrame]) -> None:
+    """Check that every sheet has the columns the bot relies on.
+
+    Raises:
+        DatasourceError: If a sheet is missing or is missing columns.
+    """
+    for name, (_, columns) in DATASOURCES.items():
+        if name not in sheets:
+            raise DatasourceError(f"The {name} sheet is missing")
+
+        missing = [column for column in columns if column not in sheets[name].columns]
+        if missing:
+            raise DatasourceError(
+                f"The {name} sheet is missing columns: {', '.join(missing)}"
+            )
+
+
+def load_roster(config: Config) -> Roster:
+    """Download, validate and index all datasource sheets.
+
+    Raises:
+        DatasourceError: If a sheet could not be downloaded or is missing columns.
+    """
+    return Roster(fetch_sheets(config), config.homeserver_url)
+
+
+def save_snapshot(path: str, roster: Roster) -> None:
+    """Persist the sheets of a roster, so the bot can start without the datasource.
+
+    The sheets are stored as CSV in a sqlite table, so they are parsed back exactly like
+    freshly downloaded ones.
+
+    Args:
+        path: The path of the snapshot database.
+
+        roster: The roster to persist.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sheets (
+                    name TEXT PRIMARY KEY,
+                    csv TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+                """
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO sheets (name, csv, fetched_at) VALUES (?, ?, ?)",
+                [
+                    (name, sheet.to_csv(index=False), roster.fetched_at)
+                    for name, sheet in roster.sheets.items()
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def load_snapshot(path: str) -> Optional[Tuple[Dict[str, pd.DataFrame], float]]:
+    """Read the sheets persisted by `save_snapshot`.
+
+    Args:
+        path: The path of the snapshot database.
+
+    Returns:
+        The sheets and when they were downloaded, or None if there is no usable snapshot.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT name, csv, fetched_at FROM sheets").fetchall()
+        finally:
+            conn.close()
+
+        sheets = {name: pd.read_csv(io.StringIO(csv)) for name, csv, _ in rows}
+        validate_sheets(sheets)
+    except (sqlite3.Error, pd.errors.ParserError, pd.errors.EmptyDataError, DatasourceError) as e:
+        logger.warning("Ignoring unusable roster snapshot at %s: %s", path, e)
+        return None
+
+    return sheets, min(fetched_at for _, _, fetched_at in rows)
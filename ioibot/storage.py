@@ -1,7 +1,10 @@
+import asyncio
 import dropbox
 import logging
+import os
 import pandas as pd
-from typing import Any, Dict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
 
 # The latest migration version of the database.
 #
@@ -10,11 +13,27 @@ from typing import Any, Dict
 # the version specified here.
 #
 # When a migration is performed, the `migration_version` table should be incremented.
-latest_migration_version = 0
+latest_migration_version = 1
+
+# Where polls and votes were kept before they moved into the bot's database
+LEGACY_POLLS_DATABASE = "ioibot.db"
 
 logger = logging.getLogger(__name__)
 
 from ioibot.config import Config
+from ioibot.database import Database
+from ioibot.dropbox_listing import DropboxListing
+from ioibot.errors import DatasourceError
+from ioibot.poll_results import ActivePollCache, PollEvents, PollResults
+from ioibot.roster import (
+    Roster,
+    RosterUser,
+    load_roster,
+    load_snapshot,
+    save_snapshot,
+)
+from ioibot.votes import VoteQueue
+
 
 class Storage:
     def __init__(self, database_config: Dict[str, str], config: Config):
@@ -32,35 +51,25 @@ class Storage:
         self.conn = self._get_database_connection(
             database_config["type"], database_config["connection_string"]
         )
-        self.vconn = self._get_database_connection(
-            database_config["type"], "ioibot.db"
-        )
-
         self.cursor = self.conn.cursor()
         self.db_type = database_config["type"]
-        self.config = Config
-        self.teams = pd.read_csv(config.team_url)
-        self.leaders = pd.read_csv(config.leader_url)
-        self.contestants = pd.read_csv(config.contestant_url)
-        self.contestants.sort_values('ContestantCode')
-        self.testing_acc = pd.read_csv(config.testing_acc_url)
-        self.testing_acc.sort_values('ContestantCode')
-        self.translation_acc = pd.read_csv(config.translation_acc_url)
-        self.tokens = pd.read_csv(config.token_url)
-        
+        self.config = config
+        self.roster_snapshot_path = os.path.join(config.store_path, "roster.db")
+        self.roster = self._load_initial_roster()
+
         # dropbox configuration
         access_token = config.db_access_token
         refresh_token = config.db_refresh_token
         app_key = config.db_app_key
         app_secret = config.db_app_secret
 
-        self.dropbox_url = pd.read_csv(config.dropbox_url)
         self.dbx = dropbox.Dropbox(
                         access_token, 
                         oauth2_refresh_token = refresh_token,
                         app_key = app_key, 
                         app_secret = app_secret
                    )
+        self.dropbox = DropboxListing(self.dbx, config.db_cache_ttl)
 
         # Try to check the current migration version
         migration_level = 0
@@ -74,7 +83,110 @@ class Storage:
             if migration_level < latest_migration_version:
                 self._run_migrations(migration_level)
 
-        logger.info(f"Database initialization of type '{self.db_type}' complete")
+        logger.info("Database initialization of type '%s' complete", self.db_type)
+
+        # Polls and votes are shared with the http server and used from the event
+        # loop, so go through a connection pool
+        self.vdb = Database(self.db_type, database_config["connection_string"])
+        self.active_poll = ActivePollCache(self.vdb)
+        self.poll_events = PollEvents()
+        self.poll_results = PollResults(self, self.poll_events)
+        self.votes = VoteQueue(self.vdb, self.poll_events)
+
+    @property
+    def teams(self) -> pd.DataFrame:
+        return self.roster.teams
+
+    @property
+    def leaders(self) -> pd.DataFrame:
+        return self.roster.leaders
+
+    @property
+    def contestants(self) -> pd.DataFrame:
+        return self.roster.contestants
+
+    @property
+    def testing_acc(self) -> pd.DataFrame:
+        return self.roster.testing_acc
+
+    @property
+    def translation_acc(self) -> pd.DataFrame:
+        return self.roster.translation_acc
+
+    @property
+    def tokens(self) -> pd.DataFrame:
+        return self.roster.tokens
+
+    @property
+    def dropbox_url(self) -> pd.DataFrame:
+        return self.roster.dropbox_url
+
+    @property
+    def users(self) -> Dict[str, RosterUser]:
+        return self.roster.users
+
+    async def refresh_roster(self) -> Roster:
+        """Fetch the datasource sheets again, and swap in the new roster once it is valid.
+
+        Raises:
+            DatasourceError: If a sheet could not be downloaded or is missing columns.
+                The current roster is kept in that case.
+        """
+        loop = asyncio.get_event_loop()
+        roster = await loop.run_in_executor(None, load_roster, self.config)
+        await loop.run_in_executor(None, self._save_roster_snapshot, roster)
+
+        # Swapping a single reference is atomic, so commands see either the old or the
+        # new roster as a whole
+        self.roster = roster
+        self.poll_results.invalidate_all()
+
+        logger.info(
+            "Roster refreshed: %d teams, %d users", len(roster.teams), len(roster.users)
+        )
+        return roster
+
+    async def refresh_roster_forever(self, interval: float) -> None:
+        """Refresh the roster every `interval` seconds, or never if it is not positive.
+
+        A roster started from the local snapshot is revalidated right away.
+        """
+        if self.roster.from_snapshot:
+            await self._try_refresh_roster()
+
+        while interval > 0:
+            await asyncio.sleep(interval)
+            await self._try_refresh_roster()
+
+    async def _try_refresh_roster(self) -> None:
+        try:
+            await self.refresh_roster()
+        except DatasourceError as e:
+            logger.warning("Unable to refresh roster, keeping the current one: %s", e)
+
+    def _load_initial_roster(self) -> Roster:
+        """Start from the local snapshot if there is one, else from the datasource.
+
+        Raises:
+            DatasourceError: If there is no snapshot and the datasource is unavailable.
+        """
+        snapshot = load_snapshot(self.roster_snapshot_path)
+        if snapshot is not None:
+            sheets, fetched_at = snapshot
+            logger.info("Starting from the roster snapshot at %s", self.roster_snapshot_path)
+            return Roster(
+                sheets, self.config.homeserver_url, fetched_at, from_snapshot=True
+            )
+
+        roster = load_roster(self.config)
+        self._save_roster_snapshot(roster)
+        return roster
+
+    def _save_roster_snapshot(self, roster: Roster) -> None:
+        try:
+            save_snapshot(self.roster_snapshot_path, roster)
+        except Exception:
+            logger.exception("Unable to save roster snapshot")
 
     def _get_database_connection(
         self, database_type: str, connection_string: str
@@ -132,15 +244,113 @@ class Storage:
         """
         logger.debug("Checking for necessary database migrations...")
 
-        # if current_migration_version < 1:
-        #    logger.info("Migrating the database from v0 to v1...")
-        #
-        #    # Add new table, delete old ones, etc.
-        #
-        #    # Update the stored migration version
-        #    self._execute("UPDATE migration_version SET version = 1")
-        #
-        #    logger.info("Database migrated to v1")
+        if current_migration_version < 1:
+            logger.info("Migrating the database from v0 to v1...")
+
+            # Attached outside of the migration's transaction, which sqlite requires
+            legacy = self._attach_legacy_polls()
+            try:
+                with self._migration(1):
+                    self._migrate_to_v1(legacy)
+            finally:
+                if legacy:
+                    self._execute("DETACH DATABASE legacy")
+
+            logger.info("Database migrated to v1")
+
+    @contextmanager
+    def _migration(self, version: int) -> Iterator[None]:
+        """Run the block and bump the migration version in a single transaction.
+
+        If anything fails, nothing of the migration is kept and it is run again on the
+        next start.
+        """
+        self._execute("BEGIN")
+        try:
+            yield
+            self._execute("UPDATE migration_version SET version = ?", (version,))
+        except BaseException:
+            self._execute("ROLLBACK")
+            raise
+        self._execute("COMMIT")
+
+    def _migrate_to_v1(self, legacy: bool) -> None:
+        """Add the polls and votes tables, with the polls of the legacy database"""
+        if self.db_type == "postgres":
+            poll_id = "SERIAL PRIMARY KEY"
+        else:
+            poll_id = "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+        self._execute(
+            f"""
+            CREATE TABLE polls (
+                poll_id {poll_id},
+                question VARCHAR NOT NULL,
+                choices VARCHAR NOT NULL,
+                active INTEGER NOT NULL DEFAULT 0
+            )
+        """
+        )
+
+        # Only one poll can be active at any time, and finding it is an index lookup
+        self._execute(
+            """
+            CREATE UNIQUE INDEX polls_active ON polls (active) WHERE active = 1
+        """
+        )
+
+        self._execute(
+            """
+            CREATE TABLE votes (
+                poll_id INTEGER NOT NULL REFERENCES polls (poll_id),
+                team_code VARCHAR NOT NULL,
+                choice VARCHAR NOT NULL,
+                voted_by VARCHAR NOT NULL,
+                voted_at TIMESTAMP NOT NULL,
+                UNIQUE (poll_id, team_code)
+            )
+        """
+        )
+
+        # Poll results are read from the index alone
+        self._execute(
+            """
+            CREATE INDEX votes_poll_id_team_code_choice
+            ON votes (poll_id, team_code, choice)
+        """
+        )
+
+        if legacy:
+            self._import_legacy_polls()
+
+    def _attach_legacy_polls(self) -> bool:
+        """Attach the separate sqlite database polls and votes used to be kept in.
+
+        Returns:
+            Whether there is a legacy database, which is attached as `legacy`.
+        """
+        if self.db_type != "sqlite" or not os.path.exists(LEGACY_POLLS_DATABASE):
+            return False
+
+        self._execute("ATTACH DATABASE ? AS legacy", (LEGACY_POLLS_DATABASE,))
+        return True
+
+    def _import_legacy_polls(self) -> None:
+        """Copy polls and votes from the attached legacy database"""
+        logger.info("Importing polls and votes from %s...", LEGACY_POLLS_DATABASE)
+
+        self._execute(
+            """
+            INSERT INTO polls (poll_id, question, choices, active)
+            SELECT poll_id, question, choices, active FROM legacy.polls
+        """
+        )
+        self._execute(
+            """
+            INSERT INTO votes (poll_id, team_code, choice, voted_by, voted_at)
+            SELECT poll_id, team_code, choice, voted_by, voted_at FROM legacy.votes
+        """
+        )
 
     def _execute(self, *args) -> None:
         """A wrapper around cursor.execute that transforms placeholder ?'s to %s for postgres.
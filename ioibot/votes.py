@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Deque, Dict, List
+
+from ioibot.database import Database
+from ioibot.keyed_queue import KeyedQueue
+from ioibot.poll_results import PollEvents
+
+logger = logging.getLogger(__name__)
+
+UPSERT_VOTE = """
+    INSERT INTO votes (poll_id, team_code, choice, voted_by, voted_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(poll_id, team_code) DO UPDATE
+    SET choice = excluded.choice, voted_by = excluded.voted_by, voted_at = excluded.voted_at
+"""
+
+
+class _Vote:
+    def __init__(
+        self, poll_id: int, team_code: str, team: str, choice: str, voted_by: str
+    ):
+        self.poll_id = poll_id
+        self.team_code = team_code
+        self.team = team
+        self.choice = choice
+        self.voted_by = voted_by
+        # Taken when the vote is received, not when its batch is written
+        self.voted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.future = asyncio.get_event_loop().create_future()
+
+    @property
+    def params(self) -> List[Any]:
+        return [self.poll_id, self.team_code, self.choice, self.voted_by, self.voted_at]
+
+    @property
+    def event(self) -> Dict[str, Any]:
+        return {"poll_id": self.poll_id, "team": self.team, "choice": self.choice}
+
+
+class VoteQueue:
+    def __init__(
+        self,
+        db: Database,
+        events: PollEvents,
+        max_batch: int = 128,
+        max_delay: float = 0.005,
+    ):
+        """Writes votes to the database in batches.
+
+        Votes that arrive while a batch is being written are committed together in the
+        next transaction, so a burst of votes costs a handful of commits instead of one
+        each. Subscribers are notified once per committed batch.
+
+        Args:
+            db: The polls database.
+
+            events: Where committed votes are published.
+
+            max_batch: The maximum number of votes written in one transaction.
+
+            max_delay: How long to wait for more votes before writing a batch, in
+                seconds.
+        """
+        self.db = db
+        self.events = events
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        # A single queue, written by one worker at a time
+        self._pending: KeyedQueue[_Vote] = KeyedQueue(self._write_next)
+
+    @property
+    def depth(self) -> int:
+        """The number of votes waiting to be written"""
+        return self._pending.depth
+
+    async def submit(
+        self, poll_id: int, team_code: str, team: str, choice: str, voted_by: str
+    ) -> None:
+        """Record a team's vote, replacing any earlier vote of the team on the poll.
+
+        Returns once the vote has been committed.
+
+        Args:
+            poll_id: The ID of the poll voted on.
+
+            team_code: The code of the voting team.
+
+            team: The name of the team, as shown in the results.
+
+            choice: The chosen option.
+
+            voted_by: The username of the voter.
+
+        Raises:
+            Exception: Whatever the database raised while writing the vote.
+        """
+        vote = _Vote(poll_id, team_code, team, choice, voted_by)
+        self._pending.put(None, vote)
+        await vote.future
+
+    async def _write_next(self, _: None, pending: Deque[_Vote]) -> None:
+        # Give the votes of the same burst a moment to join a batch that isn't full
+        if self.max_delay and len(pending) < self.max_batch:
+            await asyncio.sleep(self.max_delay)
+
+        batch = []
+        while pending and len(batch) < self.max_batch:
+            batch.append(pending.popleft())
+
+        try:
+            await self._write(batch)
+        except Exception as e:
+            logger.exception("Unable to write a batch of %d votes", len(batch))
+            for vote in batch:
+                if not vote.future.done():
+                    vote.future.set_exception(e)
+
+    async def _write(self, batch: List[_Vote]) -> None:
+        try:
+            await self.db.executemany(UPSERT_VOTE, [vote.params for vote in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+
+            # Don't fail the whole batch for one bad vote, write them one at a time
+            committed = []
+            for vote in batch:
+                try:
+                    await self.db.execute(UPSERT_VOTE, vote.params)
+                except Exception as e:
+                    if not vote.future.done():
+                        vote.future.set_exception(e)
+                else:
+                    committed.append(vote)
+            batch = committed
+
+        if batch:
+            self.events.votes([vote.event for vote in batch])
+        for vote in batch:
+            # The voter may have given up waiting
+            if not vote.future.done():
+                vote.future.set_result(None)
@@ -0,0 +1,234 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, NamedTuple, Optional
+
+from ioibot.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = Histogram(
+    "ioibot_event_loop_lag_seconds",
+    "How late the event loop woke up the watchdog's heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_STALLS = Counter(
+    "ioibot_event_loop_stalls_total",
+    "Times the event loop was blocked for longer than the watchdog's threshold",
+)
+
+
+class HandlerInfo(NamedTuple):
+    """What a task on the event loop is handling"""
+
+    command: str
+    room_id: str
+    sender: str
+
+    def __str__(self) -> str:
+        return f"'{self.command}' from {self.sender} in {self.room_id}"
+
+
+# The handler of the current task, if it is handling one
+current_handler: ContextVar[Optional[HandlerInfo]] = ContextVar(
+    "current_handler", default=None
+)
+
+# The handlers of the running tasks, for the watchdog's thread which can't see their
+# context variables
+_task_handlers: Dict["asyncio.Task", HandlerInfo] = {}
+
+
+@contextmanager
+def handling(handler: HandlerInfo) -> Iterator[None]:
+    """Mark the current task as handling something until the block exits"""
+    token = current_handler.set(handler)
+    task = asyncio.current_task()
+    if task is not None:
+        _task_handlers[task] = handler
+    try:
+        yield
+    finally:
+        if task is not None:
+            _task_handlers.pop(task, None)
+        current_handler.reset(token)
+
+
+class Stall(NamedTuple):
+    """The event loop caught being blocked"""
+
+    # When the loop last ran the watchdog's heartbeat, as a unix timestamp
+    since: float
+    # How long it had been blocked when it was caught, in seconds
+    blocked_for: float
+    handler: Optional[HandlerInfo]
+    # The task that was running, if any
+    task: Optional[str]
+    # The stack of the event loop's thread when it was caught
+    stack: str
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.5, interval: float = 0.1, keep: int = 20):
+        """Measures the lag of the event loop, and catches whatever blocks it.
+
+        A heartbeat on the event loop records how late it wakes up. A thread checks the
+        heartbeat, and once it is late by more than `threshold`, captures the stack of
+        the event loop's thread and the handler of the running task while they are
+        still blocking it.
+
+        Args:
+            threshold: How long the event loop may be blocked before it is reported, in
+                seconds.
+
+            interval: How often the heartbeat runs, in seconds.
+
+            keep: The number of recent stalls to remember.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[Stall] = deque(maxlen=keep)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat_at = 0.0
+        self._reported_beat: Optional[float] = None
+        self._heartbeat: Optional[asyncio.Future] = None
+        self._stopped: Optional[threading.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self) -> None:
+        """Start watching the running event loop. Must be called from its thread."""
+        if self.running:
+            return
+
+        self._loop = asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._stopped = threading.Event()
+        self._heartbeat = asyncio.ensure_future(self._beat())
+        thread = threading.Thread(
+            target=self._watch, args=(self._stopped,), name="loop-watchdog"
+        )
+        thread.daemon = True
+        thread.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopped.set()
+        self._heartbeat.cancel()
+        self._heartbeat = None
+
+    async def _beat(self) -> None:
+        while True:
+            self._beat_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            lag = max(0.0, time.monotonic() - self._beat_at - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            if self._reported_beat == self._beat_at:
+                logger.warning("The event loop was blocked for %.2fs", lag)
+
+    def _watch(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self.interval / 2):
+            beat_at = self._beat_at
+            blocked_for = time.monotonic() - beat_at - self.interval
+            if blocked_for > self.threshold and self._reported_beat != beat_at:
+                # Report every stall once, as soon as it is caught
+                self._reported_beat = beat_at
+                self._report(beat_at, blocked_for)
+
+    def _report(self, beat_at: float, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        task = asyncio.current_task(self._loop)
+        handler = _task_handlers.get(task) if task is not None else None
+
+        stall = Stall(
+            since=time.time() - (time.monotonic() - beat_at),
+            blocked_for=blocked_for,
+            handler=handler,
+            task=task.get_name() if task is not None else None,
+            stack=stack,
+        )
+        self.stalls.append(stall)
+        LOOP_STALLS.inc()
+        logger.warning(
+            "The event loop has been blocked for %.2fs by %s, at:\n%s",
+            blocked_for,
+            handler or stall.task or "a callback",
+            stack,
+        )
+
+
+class Profiler:
+    def __init__(self):
+        """Profiles the event loop's thread with cProfile, on demand.
+
+        Must be started and stopped from the event loop's thread, which is the one
+        being profiled.
+        """
+        self._profile: Optional[cProfile.Profile] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> bool:
+        """Start profiling.
+
+        Returns:
+            Whether profiling was started, which it isn't if it is already running.
+        """
+        if self.running:
+            return False
+
+        self._profile = cProfile.Profile()
+        self.started_at = time.time()
+        self._profile.enable()
+        return True
+
+    def stop(self, path: Optional[str] = None, limit: int = 15) -> str:
+        """Stop profiling.
+
+        Args:
+            path: A file to save the full profile to, to be read with `pstats`.
+
+            limit: The number of functions to list.
+
+        Returns:
+            The functions that took the longest, including what they called.
+
+        Raises:
+            RuntimeError: If profiling isn't running.
+        """
+        if not self.running:
+            raise RuntimeError("The profiler is not running")
+
+        profile, self._profile = self._profile, None
+        profile.disable()
+        if path is not None:
+            profile.dump_stats(path)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+# Profiling is toggled by HTC with the `profile` command, or from the config
+PROFILER = Profiler()
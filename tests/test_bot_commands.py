@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from ioibot.bot_commands import Command
+from ioibot.poll_results import ActivePoll, ActivePollCache
+from ioibot.roster import RosterUser
+from ioibot.storage import Storage
+
+from tests.utils import run_coroutine
+
+
+class CommandTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake_client = Mock(spec=nio.AsyncClient)
+        self.fake_client.room_send.side_effect = self._room_send
+        self.sent = []
+
+        # Pretend that the roster has one leader and one HTC member
+        self.fake_storage = Mock(spec=Storage)
+        self.fake_storage.roster = Mock()
+        self.fake_storage.roster.users = {
+            "@leader:example.com": RosterUser(
+                "IDN", "IDN", "Budi", "Team Leader", "Indonesia"
+            ),
+            "@htc:example.com": RosterUser("IOI", "IOI", "Andi", "HTC", "IOI"),
+        }
+
+        self.fake_config = Mock()
+
+        self.fake_room = Mock(spec=nio.MatrixRoom)
+        self.fake_room.room_id = "!abcdefg:example.com"
+
+    async def _room_send(self, room_id, message_type, content, **kwargs):
+        self.sent.append(content["body"])
+
+    def _process(self, command, sender):
+        event = Mock(spec=nio.RoomMessageText)
+        event.event_id = "$command:example.com"
+        event.sender = sender
+
+        run_coroutine(
+            Command(
+                self.fake_client,
+                self.fake_storage,
+                self.fake_config,
+                command,
+                self.fake_room,
+                event,
+            ).process()
+        )
+        return self.sent[-1]
+
+    def test_unknown_command(self):
+        """Tests that commands are matched exactly, before looking up the user"""
+        reply = self._process("information IDN", "@stranger:example.com")
+        self.assertTrue(reply.startswith("Unknown command 'information IDN'"))
+
+    def test_permissions(self):
+        """Tests that the permissions of a command are checked in order"""
+        reply = self._process("poll list", "@leader:example.com")
+        self.assertEqual(reply, "Only HTC can use this command.")
+
+        reply = self._process("vote yes", "@htc:example.com")
+        self.assertEqual(reply, "Sorry, you are not allowed to vote.")
+
+        reply = self._process("help", "@stranger:example.com")
+        self.assertTrue(reply.startswith("You are not authorized to use this bot."))
+
+    def test_help(self):
+        """Tests that the help only lists the commands the user can use"""
+        reply = self._process("help", "@leader:example.com")
+
+        self.assertIn("- `vote`: casts vote for your team", reply)
+        self.assertNotIn("`poll`", reply)
+
+    def test_info_cache(self):
+        """Tests that rendered info listings are reused"""
+        cached = {"IDN": ("Team members from IDN", "<p>cached</p>")}
+        self.fake_storage.roster.info_for.side_effect = lambda code, render: cached[code]
+
+        reply = self._process("info idn", "@leader:example.com")
+
+        self.assertEqual(reply, "Team members from IDN")
+        self.assertEqual(
+            self.fake_client.room_send.call_args[0][2]["formatted_body"], "<p>cached</p>"
+        )
+
+    def test_vote(self):
+        """Tests that votes are validated against the cached active poll"""
+        active_poll = ActivePoll.from_row(1, "Is this a question?", "yes/no/abstain")
+
+        async def get():
+            return active_poll
+
+        async def submit(*args):
+            pass
+
+        self.fake_storage.active_poll = Mock(spec=ActivePollCache)
+        self.fake_storage.active_poll.get.side_effect = get
+        self.fake_storage.votes = Mock()
+        self.fake_storage.votes.submit.side_effect = submit
+
+        reply = self._process("vote maybe", "@leader:example.com")
+        self.assertTrue(reply.startswith("Your vote is invalid."))
+        self.fake_storage.votes.submit.assert_not_called()
+
+        reply = self._process("vote no", "@leader:example.com")
+        self.assertIn("You voted `no` on behalf of the Indonesia team.", reply)
+        self.fake_storage.votes.submit.assert_called_once_with(
+            1, "IDN", "Indonesia", "no", "@leader:example.com"
+        )
+
+    def test_profile(self):
+        """Tests that HTC can profile the bot, and get the profile saved"""
+        with tempfile.TemporaryDirectory() as directory:
+            self.fake_config.store_path = directory
+
+            reply = self._process("profile stop", "@htc:example.com")
+            self.assertTrue(reply.startswith("The bot is not being profiled."))
+
+            reply = self._process("profile start", "@htc:example.com")
+            self.assertTrue(reply.startswith("Started profiling."))
+
+            reply = self._process("profile stop", "@htc:example.com")
+            self.assertIn("function calls", reply)
+            [profile] = os.listdir(directory)
+            self.assertIn(f"`{os.path.join(directory, profile)}`", reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
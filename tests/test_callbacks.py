@@ -19,6 +19,8 @@ class CallbacksTestCase(unittest.TestCase):
 
         # We don't spec config, as it doesn't currently have well defined attributes
         self.fake_config = Mock()
+        self.fake_config.command_concurrency = 4
+        self.fake_config.command_max_pending = 16
 
         self.callbacks = Callbacks(
             self.fake_client, self.fake_storage, self.fake_config
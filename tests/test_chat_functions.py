@@ -0,0 +1,39 @@
+import unittest
+
+from markdown import markdown
+
+from ioibot.chat_functions import MarkdownRenderer, render_markdown
+from ioibot.metrics import REGISTRY
+
+
+class MarkdownRendererTestCase(unittest.TestCase):
+    def test_render(self):
+        """Tests that rendering matches markdown, and that recent results are reused"""
+        renderer = MarkdownRenderer(max_size=2)
+        messages = ["Only HTC can use this command.", "- `vote yes`  \n- `vote no`"]
+
+        for message in messages + messages:
+            self.assertEqual(renderer.render(message), markdown(message))
+
+        self.assertEqual(renderer.stats()["hits"], 2)
+        self.assertEqual(renderer.stats()["misses"], 2)
+
+        # The least recently used message is evicted
+        renderer.render("Hello, world!")
+        renderer.render(messages[0])
+        self.assertEqual(renderer.stats()["misses"], 4)
+        self.assertEqual(renderer.stats()["size"], 2)
+
+    def test_metrics(self):
+        """Tests that the cache's hits and misses are exposed as metrics"""
+        render_markdown("A message rendered by the metrics test")
+        render_markdown("A message rendered by the metrics test")
+
+        metrics = REGISTRY.render()
+        self.assertIn('ioibot_markdown_cache_lookups_total{result="hit"}', metrics)
+        self.assertIn('ioibot_markdown_cache_lookups_total{result="miss"}', metrics)
+        self.assertIn("ioibot_markdown_cache_size ", metrics)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from ioibot.command_pool import CommandPool
+
+from tests.utils import run_coroutine
+
+
+class CommandPoolTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.handled = []
+        self.running = 0
+        self.max_running = 0
+
+    def _command(self, sender, number):
+        async def process():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            # Later commands of a sender finish faster, to catch reordering
+            await asyncio.sleep(0.01 / number)
+            self.handled.append((sender, number))
+            self.running -= 1
+
+        return process
+
+    def test_order_and_concurrency(self):
+        """Tests that commands of a sender run in order, with a cap on concurrency"""
+        pool = CommandPool(concurrency=2)
+
+        async def submit():
+            for number in range(1, 4):
+                for sender in ["@a:example.com", "@b:example.com", "@c:example.com"]:
+                    self.assertTrue(pool.submit(sender, self._command(sender, number)))
+
+            while pool.depth:
+                await asyncio.sleep(0.01)
+
+        run_coroutine(submit())
+
+        for sender in ["@a:example.com", "@b:example.com", "@c:example.com"]:
+            self.assertEqual(
+                [number for handled_by, number in self.handled if handled_by == sender],
+                [1, 2, 3],
+            )
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(pool.stats()["started"], 9)
+
+    def test_busy(self):
+        """Tests that commands are rejected once too many are pending"""
+        pool = CommandPool(max_pending=2)
+
+        async def submit():
+            accepted = [
+                pool.submit("@a:example.com", self._command("@a:example.com", number))
+                for number in range(1, 4)
+            ]
+            while pool.depth:
+                await asyncio.sleep(0.01)
+            return accepted
+
+        self.assertEqual(run_coroutine(submit()), [True, True, False])
+        self.assertEqual(len(self.handled), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
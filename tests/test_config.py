@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock
 
+import yaml
+
 from ioibot.config import Config
 from ioibot.errors import ConfigError
+from ioibot.logs import setup_logging
 
 
 class ConfigTestCase(unittest.TestCase):
@@ -74,6 +79,29 @@ class ConfigTestCase(unittest.TestCase):
             "something",
         )
 
+    def test_optional_sections(self):
+        """Test that a config without the optional sections still loads"""
+        with open("sample.config.yaml") as file:
+            config_dict = yaml.safe_load(file)
+
+        del config_dict["outbound"]
+        del config_dict["debug"]
+        config_dict["matrix"]["user_password"] = "password"
+        config_dict["logging"]["console_logging"]["enabled"] = False
+
+        with tempfile.TemporaryDirectory() as directory:
+            config_dict["storage"]["store_path"] = os.path.join(directory, "store")
+            path = os.path.join(directory, "config.yaml")
+            with open(path, "w") as file:
+                yaml.safe_dump(config_dict, file)
+
+            config = Config(path)
+            setup_logging([])
+
+        self.assertEqual(config.send_concurrency, 8)
+        self.assertFalse(config.coalesce_notices)
+        self.assertFalse(config.watchdog_enabled)
+
     # TODO: Test creating a test yaml file, passing the path to Config and _parse_config_values is called correctly
 
 
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from ioibot.database import Database
+
+from tests.utils import run_coroutine
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.db = Database("sqlite", os.path.join(self.tempdir.name, "test.db"))
+
+    def tearDown(self) -> None:
+        self.db.executor.shutdown()
+        self.tempdir.cleanup()
+
+    def test_queries(self):
+        """Tests that statements and queries run on the pooled connections"""
+
+        async def queries():
+            await self.db.execute("CREATE TABLE polls (poll_id INTEGER PRIMARY KEY, question TEXT)")
+            inserted = await self.db.execute(
+                "INSERT INTO polls (question) VALUES (?)", ["Is this a question?"]
+            )
+            updated = await self.db.execute(
+                "UPDATE polls SET question = ? WHERE poll_id = ?", ["What?", 10]
+            )
+            return (
+                inserted,
+                updated,
+                await self.db.fetchone("SELECT question FROM polls"),
+                await self.db.fetchall("SELECT poll_id FROM polls"),
+            )
+
+        inserted, updated, row, rows = run_coroutine(queries())
+
+        self.assertEqual(inserted.lastrowid, 1)
+        self.assertEqual(updated.rowcount, 0)
+        self.assertEqual(row, ("Is this a question?",))
+        self.assertEqual(rows, [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
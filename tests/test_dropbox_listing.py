@@ -0,0 +1,138 @@
+import unittest
+
+import dropbox
+
+from ioibot.dropbox_listing import DropboxListing
+
+from tests.utils import run_coroutine
+
+
+def file(path):
+    return dropbox.files.FileMetadata(
+        name=path.rsplit("/", 1)[1], path_lower=path.lower(), path_display=path
+    )
+
+
+def deleted(path):
+    return dropbox.files.DeletedMetadata(
+        name=path.rsplit("/", 1)[1], path_lower=path.lower(), path_display=path
+    )
+
+
+def page(entries, cursor, has_more=False):
+    return dropbox.files.ListFolderResult(
+        entries=entries, cursor=cursor, has_more=has_more
+    )
+
+
+class FakeDropbox:
+    def __init__(self):
+        """Answers listings with the pages set up by a test, recording every call"""
+        self.folders = {}
+        self.pages = {}
+        self.calls = []
+
+    def files_list_folder(self, path, recursive=False):
+        self.calls.append(("list", path))
+        return self.folders[path]
+
+    def files_list_folder_continue(self, cursor):
+        self.calls.append(("continue", cursor))
+        result = self.pages[cursor]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class DropboxListingTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dbx = FakeDropbox()
+        self.dbx.folders["/Uploads/IDN"] = page(
+            [file("/Uploads/IDN/a.cpp")], "c1", has_more=True
+        )
+        self.dbx.pages["c1"] = page([file("/Uploads/IDN/Day 1/b.pdf")], "c2")
+
+        self.listings = []
+
+    def tearDown(self) -> None:
+        for listing in self.listings:
+            listing.executor.shutdown()
+
+    def _listing(self, ttl):
+        listing = DropboxListing(self.dbx, ttl=ttl)
+        self.listings.append(listing)
+        return listing
+
+    def _list(self, listing, path="/Uploads/IDN"):
+        return run_coroutine(listing.list_files(path))
+
+    def test_pagination(self):
+        """Tests that every page of a listing is fetched"""
+        listing = self._listing(ttl=60)
+
+        self.assertEqual(self._list(listing), ["Day 1/b.pdf", "a.cpp"])
+        self.assertEqual(
+            self.dbx.calls, [("list", "/Uploads/IDN"), ("continue", "c1")]
+        )
+
+    def test_ttl(self):
+        """Tests that a fresh listing is served from the cache"""
+        listing = self._listing(ttl=60)
+        self._list(listing)
+        self.dbx.calls.clear()
+
+        self.assertEqual(self._list(listing), ["Day 1/b.pdf", "a.cpp"])
+        self.assertEqual(self.dbx.calls, [])
+
+    def test_catch_up(self):
+        """Tests that a stale listing is caught up from its cursor"""
+        listing = self._listing(ttl=0)
+        self._list(listing)
+        self.dbx.calls.clear()
+
+        self.dbx.pages["c2"] = page(
+            [file("/Uploads/IDN/c.txt"), deleted("/Uploads/IDN/Day 1")], "c3"
+        )
+
+        self.assertEqual(self._list(listing), ["a.cpp", "c.txt"])
+        self.assertEqual(self.dbx.calls, [("continue", "c2")])
+
+    def test_reset_cursor(self):
+        """Tests that a listing whose cursor was reset is listed again"""
+        listing = self._listing(ttl=0)
+        self._list(listing)
+        self.dbx.calls.clear()
+
+        self.dbx.pages["c2"] = dropbox.exceptions.ApiError(
+            "request", dropbox.files.ListFolderContinueError.reset, None, None
+        )
+        self.dbx.folders["/Uploads/IDN"] = page([file("/Uploads/IDN/d.cpp")], "c4")
+
+        self.assertEqual(self._list(listing), ["d.cpp"])
+        self.assertEqual(
+            self.dbx.calls, [("continue", "c2"), ("list", "/Uploads/IDN")]
+        )
+
+        # Carries on from the new cursor
+        self.dbx.calls.clear()
+        self.dbx.pages["c4"] = page([], "c5")
+        self.assertEqual(self._list(listing), ["d.cpp"])
+        self.assertEqual(self.dbx.calls, [("continue", "c4")])
+
+    def test_expire_changed(self):
+        """Tests that only the listings containing changes are expired"""
+        listing = self._listing(ttl=60)
+        self.dbx.folders["/Uploads/SGP"] = page([file("/Uploads/SGP/e.cpp")], "s1")
+        self._list(listing)
+        self._list(listing, "/Uploads/SGP")
+
+        self.dbx.pages["w1"] = page([file("/Uploads/IDN/f.cpp")], "w2", has_more=True)
+        self.dbx.pages["w2"] = page([], "w3")
+
+        self.assertEqual(listing._expire_changed("w1"), "w3")
+        self.assertFalse(listing._is_fresh(listing._listings["/uploads/idn"]))
+        self.assertTrue(listing._is_fresh(listing._listings["/uploads/sgp"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
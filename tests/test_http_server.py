@@ -0,0 +1,224 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from ioibot import http_server
+from ioibot.database import Database
+from ioibot.health import ConnectionHealth
+from ioibot.poll_results import ActivePollCache, PollEvents, PollResults
+
+from tests.utils import run_coroutine
+
+
+class HttpServerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+
+        # Create a fake storage with a real polls database
+        self.fake_storage = Mock()
+        self.fake_storage.vdb = Database(
+            "sqlite", os.path.join(self.tempdir.name, "ioibot.db")
+        )
+        self.fake_storage.active_poll = ActivePollCache(self.fake_storage.vdb)
+        self.fake_storage.poll_events = PollEvents()
+        self.fake_storage.poll_results = PollResults(
+            self.fake_storage, self.fake_storage.poll_events
+        )
+        self.fake_storage.roster = Mock()
+        self.fake_storage.roster.team_names = [
+            ("IDN", "Indonesia"), ("SGP", "Singapore"), ("IOI", "IOI")
+        ]
+        self.fake_storage.roster.voting_team_names = [
+            ("IDN", "Indonesia"), ("SGP", "Singapore")
+        ]
+
+        self.fake_config = Mock()
+
+    def tearDown(self) -> None:
+        self.fake_storage.vdb.executor.shutdown()
+        self.tempdir.cleanup()
+
+    async def _create_poll(self):
+        db = self.fake_storage.vdb
+        await db.execute(
+            """CREATE TABLE polls (poll_id integer PRIMARY KEY AUTOINCREMENT,
+            question varchar, choices varchar, active bit)"""
+        )
+        await db.execute(
+            """CREATE TABLE votes (poll_id integer, team_code varchar, choice varchar,
+            voted_by varchar, voted_at datetime, UNIQUE(poll_id, team_code))"""
+        )
+        await db.execute(
+            """INSERT INTO polls (question, choices, active) VALUES (?, ?, 1)""",
+            ["Is this a question?", "yes/no/abstain"],
+        )
+        await db.execute(
+            """INSERT INTO votes VALUES (1, 'IDN', 'yes', '@idn:example.com', 0)"""
+        )
+
+    def test_active_poll(self):
+        """Tests that the active poll is returned with a vote per voting team"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/polls/active")
+                return await response.json()
+
+        self.assertEqual(
+            run_coroutine(request()),
+            {
+                "poll_id": 1,
+                "question": "Is this a question?",
+                "votes": {"Indonesia": "yes", "Singapore": None},
+            },
+        )
+
+    def test_conditional_request(self):
+        """Tests that unchanged results are answered with a 304 until a vote comes in"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/polls/1")
+                etag = response.headers["ETag"]
+
+                unchanged = await client.get("/polls/1", headers={"If-None-Match": etag})
+
+                self.fake_storage.poll_events.votes(
+                    [{"poll_id": 1, "team": "Singapore", "choice": "no"}]
+                )
+                changed = await client.get("/polls/1", headers={"If-None-Match": etag})
+
+                return unchanged.status, changed.status, changed.headers["ETag"] != etag
+
+        self.assertEqual(run_coroutine(request()), (304, 200, True))
+
+    def test_etag_after_restart(self):
+        """Tests that an ETag from an earlier process doesn't match a new result"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/polls/1")
+                etag = response.headers["ETag"]
+
+                # Restart, with a vote that came in while the bot was down
+                self.fake_storage.poll_results = PollResults(
+                    self.fake_storage, PollEvents()
+                )
+                await self.fake_storage.vdb.execute(
+                    """INSERT INTO votes VALUES (1, 'SGP', 'no', '@sgp:example.com', 0)"""
+                )
+
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/polls/1", headers={"If-None-Match": etag})
+                return response.status
+
+        self.assertEqual(run_coroutine(request()), 200)
+
+    def test_active_poll_stream(self):
+        """Tests that the stream pushes a snapshot followed by vote deltas"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/polls/active/stream")
+                snapshot = await self._read_event(response)
+
+                self.fake_storage.poll_events.votes(
+                    [{"poll_id": 1, "team": "Singapore", "choice": "no"}]
+                )
+                vote = await self._read_event(response)
+
+                response.close()
+                return snapshot, vote
+
+        snapshot, vote = run_coroutine(request())
+
+        self.assertEqual(snapshot[0], "snapshot")
+        self.assertEqual(snapshot[1]["votes"]["Indonesia"], "yes")
+        self.assertEqual(
+            vote, ("votes", [{"poll_id": 1, "team": "Singapore", "choice": "no"}])
+        )
+
+    def test_summary(self):
+        """Tests that the tally follows new and changed votes"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                before = await (await client.get("/polls/1/summary")).json()
+
+                self.fake_storage.poll_events.votes(
+                    [
+                        {"poll_id": 1, "team": "Indonesia", "choice": "no"},
+                        {"poll_id": 1, "team": "Singapore", "choice": "abstain"},
+                    ]
+                )
+                after = await (await client.get("/polls/active/summary")).json()
+
+                return before["tally"], after["tally"], after["voted"]
+
+        before, after, voted = run_coroutine(request())
+
+        self.assertEqual(before, {"yes": 1, "no": 0, "abstain": 0})
+        self.assertEqual(after, {"yes": 0, "no": 1, "abstain": 1})
+        self.assertEqual(voted, 2)
+
+    def test_metrics(self):
+        """Tests that the metrics include the time spent on database queries"""
+
+        async def request():
+            await self._create_poll()
+            app = await http_server.create_app(self.fake_config, self.fake_storage)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/metrics")
+                return response.headers["Content-Type"], await response.text()
+
+        content_type, text = run_coroutine(request())
+
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+        self.assertIn('ioibot_db_query_seconds_count{operation="execute"}', text)
+
+    def test_health(self):
+        """Tests that the health endpoint follows the connection to the homeserver"""
+        health = ConnectionHealth()
+
+        async def request():
+            app = await http_server.create_app(self.fake_config, self.fake_storage, health)
+            async with TestClient(TestServer(app)) as client:
+                health.disconnected("ClientConnectionError()", 1)
+                reconnecting = await client.get("/health")
+
+                health.synced()
+                connected = await client.get("/health")
+
+                return (
+                    reconnecting.status,
+                    (await reconnecting.json())["state"],
+                    connected.status,
+                    (await connected.json())["failures"],
+                )
+
+        self.assertEqual(run_coroutine(request()), (503, "reconnecting", 200, 0))
+
+    async def _read_event(self, response):
+        event = (await response.content.readline()).decode()[len("event: ") :].strip()
+        data = (await response.content.readline()).decode()[len("data: ") :]
+        await response.content.readline()
+        return event, json.loads(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
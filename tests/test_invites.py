@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from ioibot.invites import BulkInviter
+
+from tests.utils import run_coroutine
+
+
+class BulkInviterTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tempdir.name, "invites.json")
+
+        self.fake_client = Mock(spec=nio.AsyncClient)
+        self.fake_client.rooms = {}
+
+        # Pretend that one user has already joined the room
+        member = Mock()
+        member.user_id = "@joined:example.com"
+        self.fake_client.joined_members.side_effect = self._joined_members(member)
+
+        self.responses = {
+            "@invited:example.com": [Mock(spec=nio.RoomInviteResponse)],
+            "@limited:example.com": [
+                nio.RoomInviteError("Too many requests", "M_LIMIT_EXCEEDED", 10),
+                Mock(spec=nio.RoomInviteResponse),
+            ],
+            "@banned:example.com": [nio.RoomInviteError("User is banned", "M_FORBIDDEN")],
+        }
+        self.fake_client.room_invite.side_effect = self._room_invite
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def _joined_members(self, member):
+        async def joined_members(room_id):
+            return nio.JoinedMembersResponse([member], room_id)
+
+        return joined_members
+
+    async def _room_invite(self, room_id, user_id):
+        return self.responses[user_id].pop(0)
+
+    def test_invite(self):
+        """Tests that users are invited, skipped or reported as failed"""
+        inviter = BulkInviter(self.fake_client, self.state_path)
+        user_ids = [
+            "@invited:example.com",
+            "@limited:example.com",
+            "@joined:example.com",
+            "@banned:example.com",
+        ]
+
+        report = run_coroutine(inviter.invite("!room:example.com", user_ids))
+
+        self.assertCountEqual(
+            report.invited, ["@invited:example.com", "@limited:example.com"]
+        )
+        self.assertEqual(report.skipped, ["@joined:example.com"])
+        self.assertEqual(report.failed, {"@banned:example.com": "User is banned"})
+
+        # Failed users are left for a resumed run
+        self.assertEqual(
+            inviter.pending("!room:example.com"), ["@banned:example.com"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+
+from ioibot.keyed_queue import KeyedQueue
+
+from tests.utils import run_coroutine
+
+
+class KeyedQueueTestCase(unittest.TestCase):
+    def test_order(self):
+        """Tests that items are handled in order per key, and workers stop when idle"""
+        handled = []
+
+        async def drain(key, pending):
+            item = pending.popleft()
+            if item == "broken":
+                raise ValueError(item)
+            await asyncio.sleep(0.01 / (len(handled) + 1))
+            handled.append((key, item))
+
+        queue = KeyedQueue(drain)
+
+        async def put():
+            for item in ["a", "broken", "b", "c"]:
+                queue.put("!room1", item)
+                queue.put("!room2", item)
+            self.assertEqual(queue.depth, 8)
+
+            while queue._queues:
+                await asyncio.sleep(0.01)
+
+        run_coroutine(put())
+
+        for key in ["!room1", "!room2"]:
+            self.assertEqual(
+                [item for k, item in handled if k == key], ["a", "b", "c"]
+            )
+        self.assertEqual(queue.depth, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
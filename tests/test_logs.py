@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+import unittest
+
+from ioibot.logs import JsonFormatter, request_scope, setup_logging, stop_logging
+from ioibot.watchdog import HandlerInfo, handling
+
+from tests.utils import run_coroutine
+
+
+class LogsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(JsonFormatter())
+        setup_logging([handler])
+
+        self.logger = logging.getLogger("tests.logs")
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self) -> None:
+        setup_logging([])
+
+    def _lines(self):
+        # Wait for the listener to write out the queue
+        stop_logging()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_context(self):
+        """Tests that records are tagged with the command being handled"""
+        handler = HandlerInfo("vote", "!room:example.com", "@leader:example.com")
+
+        async def command():
+            with request_scope("$event"), handling(handler):
+                self.logger.info("Voted %s", "yes")
+
+        run_coroutine(command())
+        self.logger.info("Done")
+
+        first, second = self._lines()
+        self.assertEqual(first["message"], "Voted yes")
+        self.assertEqual(first["level"], "INFO")
+        self.assertEqual(first["logger"], "tests.logs")
+        self.assertEqual(first["request_id"], "$event")
+        self.assertEqual(first["command"], "vote")
+        self.assertEqual(first["room_id"], "!room:example.com")
+        self.assertEqual(first["sender"], "@leader:example.com")
+
+        self.assertEqual(second["message"], "Done")
+        self.assertNotIn("request_id", second)
+        self.assertNotIn("command", second)
+
+    def test_exception(self):
+        """Tests that exceptions are kept apart from the message"""
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            self.logger.exception("Unable to %s", "vote")
+        self.logger.debug("Not logged")
+
+        [line] = self._lines()
+        self.assertEqual(line["message"], "Unable to vote")
+        self.assertIn('ValueError: broken', line["exception"])
+
+
+if __name__ == "__main__":
+    unittest.main()
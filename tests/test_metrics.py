@@ -0,0 +1,55 @@
+import unittest
+
+from ioibot.metrics import Counter, Gauge, Histogram, Registry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+
+    def test_render(self):
+        """Tests that metrics are rendered in the Prometheus text format"""
+        errors = Counter(
+            "errors_total", "Errors", ["code"], registry=self.registry
+        )
+        depth = Gauge("depth", "Depth", registry=self.registry)
+        latency = Histogram(
+            "latency_seconds", "Latency", buckets=(0.1, 1), registry=self.registry
+        )
+
+        errors.inc(code='M_"LIMIT"')
+        errors.inc(2, code='M_"LIMIT"')
+        depth.set_function(lambda: 3)
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP errors_total Errors\n"
+            "# TYPE errors_total counter\n"
+            'errors_total{code="M_\\"LIMIT\\""} 3\n'
+            "# HELP depth Depth\n"
+            "# TYPE depth gauge\n"
+            "depth 3\n"
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{le="0.1"} 1\n'
+            'latency_seconds_bucket{le="1"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 3\n'
+            "latency_seconds_sum 5.55\n"
+            "latency_seconds_count 3\n",
+        )
+
+    def test_labels(self):
+        """Tests that metrics are only accepted with their declared labels"""
+        errors = Counter("errors_total", "Errors", ["code"], registry=self.registry)
+
+        with self.assertRaises(ValueError):
+            errors.inc(status="500")
+        with self.assertRaises(ValueError):
+            Counter("errors_total", "Errors", registry=self.registry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from ioibot.outbound import OutboundQueue
+
+from tests.utils import run_coroutine
+
+
+class OutboundQueueTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake_client = Mock(spec=nio.AsyncClient)
+        self.fake_client.room_send.side_effect = self._room_send
+
+        self.sent = []
+        self.responses = []
+
+    async def _room_send(self, room_id, message_type, content, **kwargs):
+        await asyncio.sleep(0)
+        if self.responses:
+            return self.responses.pop(0)
+
+        self.sent.append((room_id, content["body"]))
+        return Mock(spec=nio.RoomSendResponse)
+
+    def _notice(self, body):
+        return {"msgtype": "m.notice", "body": body, "formatted_body": f"<p>{body}</p>"}
+
+    def test_order_and_rate_limit(self):
+        """Tests that messages to a room are sent in order, waiting out rate limits"""
+        queue = OutboundQueue(self.fake_client)
+        self.responses.append(
+            nio.RoomSendError("Too many requests", "M_LIMIT_EXCEEDED", 10)
+        )
+
+        async def send():
+            await asyncio.gather(
+                *(
+                    queue.send("!room:example.com", "m.room.message", self._notice(body))
+                    for body in ["one", "two", "three"]
+                )
+            )
+
+        run_coroutine(send())
+
+        self.assertEqual(
+            self.sent,
+            [
+                ("!room:example.com", "one"),
+                ("!room:example.com", "two"),
+                ("!room:example.com", "three"),
+            ],
+        )
+        self.assertEqual(queue.depth, 0)
+
+    def test_coalesce(self):
+        """Tests that notices waiting for the same room are merged"""
+        queue = OutboundQueue(self.fake_client, coalesce=True)
+
+        async def send():
+            first = queue.send("!room:example.com", "m.room.message", self._notice("one"))
+            second = queue.send("!room:example.com", "m.room.message", self._notice("two"))
+            other = queue.send("!other:example.com", "m.room.message", self._notice("three"))
+            return await asyncio.gather(first, second, other)
+
+        first, second, other = run_coroutine(send())
+
+        self.assertCountEqual(
+            self.sent,
+            [("!room:example.com", "one\n\ntwo"), ("!other:example.com", "three")],
+        )
+        self.assertIs(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from ioibot.errors import DatasourceError
+from ioibot.roster import (
+    DATASOURCES,
+    Roster,
+    RosterUser,
+    load_snapshot,
+    save_snapshot,
+    validate_sheets,
+)
+
+
+class RosterTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # Pretend that these were read from the datasource spreadsheets
+        self.sheets = {
+            name: pd.DataFrame(columns=columns)
+            for name, (_, columns) in DATASOURCES.items()
+        }
+        self.sheets["teams"] = pd.DataFrame(
+            {
+                "Code": ["IDN", "SGP"],
+                "Name": ["Indonesia", "Singapore"],
+                "Visible": [1, 1],
+                "Voting": [1, 1],
+            }
+        )
+        self.sheets["leaders"] = pd.DataFrame(
+            {
+                "UserID": ["idn-leader", "sgp-deputy", "ghost", None, "idn-leader"],
+                "TeamCode": ["IDN", "SGP", "XXX", "IDN", "SGP"],
+                "RealTeamCode": ["IDN", "SGP", "XXX", "IDN", "SGP"],
+                "Name": ["Budi", "Wei", "Nobody", "Empty", "Duplicate"],
+                "Role": ["Team Leader", "Deputy Leader", "Guest", "Guest", "Guest"],
+                "Chair": [0, 0, 0, 0, 0],
+                "Matrix Exists": ["Y", "Y", "Y", "N", "Y"],
+                "Translating": [1, 1, 0, 0, 0],
+            }
+        )
+
+    def test_user_index(self):
+        """Tests that the leaders sheet is indexed by MXID"""
+        users = Roster(self.sheets, "https://example.com").users
+
+        # The first row of a user wins, and rows without a user ID are skipped
+        self.assertEqual(
+            users,
+            {
+                "@idn-leader:example.com": RosterUser(
+                    "IDN", "IDN", "Budi", "Team Leader", "Indonesia"
+                ),
+                "@sgp-deputy:example.com": RosterUser(
+                    "SGP", "SGP", "Wei", "Deputy Leader", "Singapore"
+                ),
+            },
+        )
+
+        # Users whose team is unknown are not authorized
+        self.assertNotIn("@ghost:example.com", users)
+
+    def test_validate_sheets(self):
+        """Tests that sheets missing columns are rejected"""
+        validate_sheets(self.sheets)
+
+        self.sheets["teams"] = self.sheets["teams"].drop(columns=["Voting"])
+        with self.assertRaises(DatasourceError):
+            validate_sheets(self.sheets)
+
+        del self.sheets["tokens"]
+        with self.assertRaises(DatasourceError):
+            validate_sheets(self.sheets)
+
+    def test_snapshot(self):
+        """Tests that a roster can be restored from its local snapshot"""
+        roster = Roster(self.sheets, "https://example.com", fetched_at=1234.0)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "roster.db")
+            self.assertIsNone(load_snapshot(path))
+
+            save_snapshot(path, roster)
+            sheets, fetched_at = load_snapshot(path)
+
+        self.assertEqual(fetched_at, 1234.0)
+        assert_frame_equal(sheets["leaders"], self.sheets["leaders"])
+        self.assertEqual(
+            Roster(sheets, "https://example.com", fetched_at).users, roster.users
+        )
+
+    def test_info_for(self):
+        """Tests that info listings are rendered once, unless the code is not found"""
+        roster = Roster(self.sheets, "https://example.com")
+        rendered = []
+
+        def render(info):
+            rendered.append(info)
+            return info
+
+        self.assertEqual(roster.info_for("IDN", lambda: render(("a", "b"))), ("a", "b"))
+        self.assertEqual(roster.info_for("IDN", lambda: render(("c", "d"))), ("a", "b"))
+        self.assertIsNone(roster.info_for("XYZ", lambda: render(None)))
+        self.assertIsNone(roster.info_for("XYZ", lambda: render(None)))
+        self.assertEqual(rendered, [("a", "b"), None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
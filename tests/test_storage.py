@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from ioibot import storage
+from ioibot.storage import Storage
+
+
+class StorageMigrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+
+        # Only the database part of the storage, without the roster and Dropbox
+        self.store = Storage.__new__(Storage)
+        self.store.db_type = "sqlite"
+        self.store.conn = self.store._get_database_connection(
+            "sqlite", os.path.join(self.tempdir.name, "bot.db")
+        )
+        self.store.cursor = self.store.conn.cursor()
+
+    def tearDown(self) -> None:
+        self.store.conn.close()
+        self.tempdir.cleanup()
+
+    def _migrate(self):
+        self.store._initial_setup()
+        self.store._run_migrations(0)
+
+    def test_polls_schema(self):
+        """Tests that polls and votes are created with their indexes"""
+        self._migrate()
+        cursor = self.store.cursor
+
+        cursor.execute("SELECT version FROM migration_version")
+        self.assertEqual(cursor.fetchone(), (storage.latest_migration_version,))
+
+        cursor.execute("INSERT INTO polls (question, choices, active) VALUES ('a', 'b', 1)")
+        with self.assertRaises(sqlite3.IntegrityError):
+            cursor.execute(
+                "INSERT INTO polls (question, choices, active) VALUES ('c', 'd', 1)"
+            )
+
+        cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT team_code, choice FROM votes WHERE poll_id = 1"
+        )
+        self.assertIn("COVERING INDEX", cursor.fetchone()[-1])
+
+    def _create_legacy_database(self, *polls):
+        legacy_path = os.path.join(self.tempdir.name, "ioibot.db")
+        legacy = sqlite3.connect(legacy_path)
+        legacy.execute(
+            """CREATE TABLE polls (poll_id integer PRIMARY KEY AUTOINCREMENT,
+            question varchar, choices varchar, active bit)"""
+        )
+        legacy.execute(
+            """CREATE TABLE votes (poll_id integer, team_code varchar, choice varchar,
+            voted_by varchar, voted_at datetime, UNIQUE(poll_id, team_code))"""
+        )
+        for poll_id, active in polls:
+            legacy.execute(
+                "INSERT INTO polls VALUES (?, 'Is this a question?', 'yes/no', ?)",
+                (poll_id, active),
+            )
+        legacy.execute(
+            "INSERT INTO votes VALUES (3, 'IDN', 'yes', '@idn:example.com', '2022-08-08')"
+        )
+        legacy.commit()
+        legacy.close()
+        return legacy_path
+
+    def _migrate_with_legacy_database(self, legacy_path):
+        legacy_database = storage.LEGACY_POLLS_DATABASE
+        storage.LEGACY_POLLS_DATABASE = legacy_path
+        try:
+            self.store._run_migrations(0)
+        finally:
+            storage.LEGACY_POLLS_DATABASE = legacy_database
+
+    def test_legacy_import(self):
+        """Tests that polls and votes are copied from the old separate database"""
+        self.store._initial_setup()
+        self._migrate_with_legacy_database(self._create_legacy_database((3, 1)))
+
+        cursor = self.store.cursor
+        cursor.execute("SELECT poll_id, active FROM polls")
+        self.assertEqual(cursor.fetchall(), [(3, 1)])
+        cursor.execute("SELECT team_code, choice FROM votes")
+        self.assertEqual(cursor.fetchall(), [("IDN", "yes")])
+
+    def test_failed_migration(self):
+        """Tests that a migration failing halfway leaves nothing behind"""
+        self.store._initial_setup()
+        legacy_path = self._create_legacy_database((3, 1), (4, 1))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self._migrate_with_legacy_database(legacy_path)
+
+        cursor = self.store.cursor
+        cursor.execute("SELECT version FROM migration_version")
+        self.assertEqual(cursor.fetchone(), (0,))
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'polls'")
+        self.assertIsNone(cursor.fetchone())
+
+        # Runs again once the legacy database is fixed
+        os.remove(legacy_path)
+        self._migrate_with_legacy_database(self._create_legacy_database((3, 1), (4, 0)))
+        cursor.execute("SELECT poll_id, active FROM polls")
+        self.assertEqual(cursor.fetchall(), [(3, 1), (4, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
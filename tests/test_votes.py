@@ -0,0 +1,90 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ioibot.database import Database
+from ioibot.poll_results import PollEvents
+from ioibot.votes import VoteQueue
+
+from tests.utils import run_coroutine
+
+
+class VoteQueueTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.db = Database("sqlite", os.path.join(self.tempdir.name, "ioibot.db"))
+
+        self.events = PollEvents()
+        self.published = []
+        self.events.add_listener(lambda event, data: self.published.append(event))
+
+        run_coroutine(
+            self.db.execute(
+                """CREATE TABLE votes (poll_id integer, team_code varchar,
+                choice varchar, voted_by varchar, voted_at datetime,
+                UNIQUE(poll_id, team_code))"""
+            )
+        )
+
+    def tearDown(self) -> None:
+        self.db.executor.shutdown()
+        self.tempdir.cleanup()
+
+    def test_batch(self):
+        """Tests that a burst of votes is committed and published as one batch"""
+        votes = VoteQueue(self.db, self.events)
+
+        async def vote():
+            await asyncio.gather(
+                votes.submit(1, "IDN", "Indonesia", "yes", "@idn:example.com"),
+                votes.submit(1, "SGP", "Singapore", "no", "@sgp:example.com"),
+                votes.submit(1, "IDN", "Indonesia", "no", "@idn:example.com"),
+            )
+            return await self.db.fetchall(
+                "SELECT team_code, choice FROM votes ORDER BY team_code"
+            )
+
+        rows = run_coroutine(vote())
+
+        self.assertEqual(rows, [("IDN", "no"), ("SGP", "no")])
+        self.assertEqual(self.published, ["votes"])
+
+    def test_failed_vote(self):
+        """Tests that a vote that cannot be written fails only its own voter"""
+        votes = VoteQueue(self.db, self.events)
+
+        async def vote():
+            return await asyncio.gather(
+                votes.submit(1, "IDN", "Indonesia", "yes", "@idn:example.com"),
+                votes.submit(1, "SGP", "Singapore", ["not", "a", "choice"], "@sgp:example.com"),
+                return_exceptions=True,
+            )
+
+        ok, failed = run_coroutine(vote())
+
+        self.assertIsNone(ok)
+        self.assertIsInstance(failed, Exception)
+        self.assertEqual(self.published, ["votes"])
+
+    def test_cancelled_voter(self):
+        """Tests that a voter who stops waiting doesn't fail the rest of the batch"""
+        votes = VoteQueue(self.db, self.events)
+
+        async def vote():
+            cancelled = asyncio.ensure_future(
+                votes.submit(1, "IDN", "Indonesia", "yes", "@idn:example.com")
+            )
+            waiting = asyncio.ensure_future(
+                votes.submit(1, "SGP", "Singapore", "no", "@sgp:example.com")
+            )
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            return await waiting
+
+        self.assertIsNone(run_coroutine(vote()))
+        self.assertEqual(self.published, ["votes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
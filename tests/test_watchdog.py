@@ -0,0 +1,55 @@
+import asyncio
+import time
+import unittest
+
+from ioibot.watchdog import HandlerInfo, LoopWatchdog, current_handler, handling
+
+from tests.utils import run_coroutine
+
+
+def block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+class LoopWatchdogTestCase(unittest.TestCase):
+    def test_stall(self):
+        """Tests that a blocked event loop is caught with the handler blocking it"""
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+        handler = HandlerInfo("dropbox", "!room:example.com", "@leader:example.com")
+
+        async def command():
+            with handling(handler):
+                self.assertEqual(current_handler.get(), handler)
+                block_the_loop(0.2)
+            self.assertIsNone(current_handler.get())
+
+        async def watch():
+            watchdog.start()
+            await asyncio.sleep(0.05)
+            await asyncio.ensure_future(command())
+            await asyncio.sleep(0.05)
+            watchdog.stop()
+
+        run_coroutine(watch())
+
+        [stall] = watchdog.stalls
+        self.assertEqual(stall.handler, handler)
+        self.assertGreater(stall.blocked_for, 0.05)
+        self.assertIn("block_the_loop", stall.stack)
+
+    def test_no_stall(self):
+        """Tests that an event loop that keeps up is not reported"""
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+
+        async def watch():
+            watchdog.start()
+            await asyncio.sleep(0.2)
+            watchdog.stop()
+
+        run_coroutine(watch())
+
+        self.assertEqual(len(watchdog.stalls), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
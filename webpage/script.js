@@ -1,10 +1,44 @@
 function fetchPollResult() {
+	if(!window.EventSource) {
+		pollPollResult();
+		return;
+	}
+
+	// the server pushes a snapshot on connect and whenever the active poll
+	// changes, then a delta for every batch of votes; EventSource reconnects
+	// by itself
+	var data = {};
+	var source = new EventSource("./polls/active/stream");
+
+	source.addEventListener("snapshot", function(event) {
+		data = JSON.parse(event.data);
+		refreshPoll(data);
+		refreshCounter(data);
+	});
+
+	source.addEventListener("votes", function(event) {
+		var votes = JSON.parse(event.data);
+		if(!data.votes) {
+			return;
+		}
+
+		votes.forEach(function(vote) {
+			if(data.votes.hasOwnProperty(vote.team)) {
+				data.votes[vote.team] = vote.choice;
+			}
+		});
+		refreshPoll(data);
+		refreshCounter(data);
+	});
+}
+
+function pollPollResult() {
 	$.get("./polls/active", function(data) {
 		refreshPoll(data);
 		refreshCounter(data);
 
 		setTimeout(function () {
-			fetchPollResult(data);
+			pollPollResult(data);
 		}, 3000); 
 	});
 }